@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+import zlib
+
+# Results of finished root searches kept on disk between sessions, so that positions seen in earlier games come
+# back without searching. The file is a header followed by buckets of BUCKET_SIZE fixed-size records, and is only
+# opened and mapped into memory the first time it is needed. Results found during a game are held in memory until
+# save(), which writes them to the file and is meant to be called at the end of each game; a full bucket makes room
+# by dropping its shallowest result. Each record keeps the position's Zobrist key XORed with a checksum of the rest
+# of the record, so that a record torn by two processes saving at once reads as empty rather than wrong.
+class AnalysisCache():
+    BUCKET_SIZE = 4
+    MAX_CONT = 32
+    MAGIC = b"ECACHE01"
+    HEADER = struct.Struct("<8sQ")
+    # Key, value, move, depth, quiescence depth, reason kind, continuation length, reason scores and continuation
+    RECORD = struct.Struct("<QiHBBbB4i" + str(MAX_CONT) + "H")
+    # Reason kinds besides the result of a finished game: a heuristic breakdown, or none as the search gave none
+    HEURISTIC = 2
+    NO_REASON = 3
+
+    def __init__(self, path, sizeMB=16):
+        self.path = path
+        self.sizeMB = sizeMB
+        self.file = None
+        self.map = None
+        self.buckets = 0
+        self.pending = {}
+
+    def open(self, create=False):
+        if self.map != None:
+            return True
+        if not create and not os.path.exists(self.path):
+            return False
+        self.file = open(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size >= self.HEADER.size:
+            self.file.seek(0)
+            magic, buckets = self.HEADER.unpack(self.file.read(self.HEADER.size))
+            if magic == self.MAGIC and size == self.fileSize(buckets):
+                self.buckets = buckets
+        if not self.buckets:
+            # Missing or not a cache of this layout: start a new one of the configured size
+            buckets = max(1, self.sizeMB * 2**20 // (self.RECORD.size * self.BUCKET_SIZE))
+            self.buckets = 1 << (buckets.bit_length() - 1)
+            self.file.truncate(0)
+            self.file.truncate(self.fileSize(self.buckets))
+            self.file.seek(0)
+            self.file.write(self.HEADER.pack(self.MAGIC, self.buckets))
+            self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        return True
+
+    def fileSize(self, buckets: int) -> int:
+        return self.HEADER.size + buckets * self.BUCKET_SIZE * self.RECORD.size
+
+    # (depth, quiescenceDepth, value, move, reason, cont) of the position, reason being None if it was not kept
+    def probe(self, key: int):
+        if key in self.pending:
+            return self.pending[key]
+        if not self.open():
+            return None
+        for offset in self.bucket(key):
+            record = self.readRecord(offset)
+            if record != None and record[0] == key:
+                return record[1:]
+        return None
+
+    def store(self, key: int, depth: int, quiescenceDepth: int, value: int, move: int, reason=None, cont=()):
+        if len(cont) > self.MAX_CONT:
+            return
+        known = self.probe(key)
+        if known != None and (known[0], known[1]) > (depth, quiescenceDepth):
+            return
+        self.pending[key] = (depth, quiescenceDepth, value, move, reason, list(cont))
+
+    def save(self):
+        if not self.pending:
+            return
+        self.open(create=True)
+        for key, result in self.pending.items():
+            target = None
+            targetRank = None
+            for offset in self.bucket(key):
+                record = self.readRecord(offset)
+                if record != None and record[0] == key:
+                    # Another process may have saved a deeper search of the position since
+                    target = offset if (record[1], record[2]) <= result[:2] else None
+                    break
+                # An empty record goes before any result
+                rank = (-1, -1) if record == None else (record[1], record[2])
+                if target == None or rank < targetRank:
+                    target, targetRank = offset, rank
+            if target != None:
+                self.writeRecord(target, key, *result)
+        self.map.flush()
+        self.pending.clear()
+
+    def close(self):
+        if self.map != None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+    def bucket(self, key: int) -> range:
+        start = self.HEADER.size + (key & (self.buckets - 1)) * self.BUCKET_SIZE * self.RECORD.size
+        return range(start, start + self.BUCKET_SIZE * self.RECORD.size, self.RECORD.size)
+
+    def readRecord(self, offset: int):
+        fields = self.RECORD.unpack_from(self.map, offset)
+        check, value, move, depth, quiescenceDepth, kind, contLength = fields[:7]
+        if not move:
+            return None
+        key = check ^ zlib.crc32(self.map[offset + 8:offset + self.RECORD.size])
+        if kind == self.NO_REASON:
+            reason = None
+        else:
+            reason = ["N/A" if kind == self.HEURISTIC else kind] + list(fields[7:11])
+        return key, depth, quiescenceDepth, value, move, reason, list(fields[11:11 + contLength])
+
+    def writeRecord(self, offset: int, key: int, depth: int, quiescenceDepth: int, value: int, move: int, reason, cont):
+        if reason == None:
+            kind, scores = self.NO_REASON, [0, 0, 0, 0]
+        else:
+            kind, scores = self.HEURISTIC if reason[0] == "N/A" else reason[0], reason[1:]
+        self.RECORD.pack_into(self.map, offset, 0, value, move, depth, quiescenceDepth, kind, len(cont), *scores,
+                              *cont, *[0] * (self.MAX_CONT - len(cont)))
+        check = key ^ zlib.crc32(self.map[offset + 8:offset + self.RECORD.size])
+        struct.pack_into("<Q", self.map, offset, check)
@@ -1,4 +1,5 @@
 from bitarray import bitarray
+import colour
 
 def posToIndex(position: str) -> int:
     if len(position) != 2:
@@ -12,75 +13,141 @@ def indexToPos(index: int) -> str:
     fileTranslation = {0: "a", 1: "b", 2: "c", 3: "d", 4: "e", 5: "f", 6: "g", 7: "h"}
     return fileTranslation[index % 8] + str(1 + index // 8 )
 
-def northMask(position: int):
-    result = bitarray('0000000010000000100000001000000010000000100000001000000010000000') >> position
+# Square i of the board is index i of a mask and bit i of the equivalent int (a1 = 0, h8 = 63)
+def bitsToMask(bits: int):
+    return bitarray(format(bits, '064b')[::-1])
+
+def maskToBits(mask) -> int:
+    return int.from_bytes(mask[::-1].tobytes(), 'big')
+
+# Squares of the set bits of an int, lowest first
+def bitSquares(bits: int):
+    while bits:
+        lsb = bits & -bits
+        yield lsb.bit_length() - 1
+        bits ^= lsb
+
+# (file, rank) offsets of each ray direction, keyed by the index step it takes per square
+DIRECTIONS = {-9: (-1, -1), -8: (0, -1), -7: (1, -1), -1: (-1, 0), 1: (1, 0), 7: (-1, 1), 8: (0, 1), 9: (1, 1)}
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+
+def _offsetSquare(position: int, fileDelta: int, rankDelta: int) -> int:
+    file, rank = position % 8 + fileDelta, position // 8 + rankDelta
+    if 0 <= file < 8 and 0 <= rank < 8:
+        return rank*8+file
+    return -1
+
+def _squaresToBits(squares) -> int:
+    result = 0
+    for square in squares:
+        result |= 1 << square
     return result
 
+# Squares reached by walking from each square in each direction, nearest first
+RAY_SQUARES = [{} for _ in range(64)]
+for _position in range(64):
+    for _step, (_fileDelta, _rankDelta) in DIRECTIONS.items():
+        _ray = []
+        _square = _offsetSquare(_position, _fileDelta, _rankDelta)
+        while _square != -1:
+            _ray.append(_square)
+            _square = _offsetSquare(_square, _fileDelta, _rankDelta)
+        RAY_SQUARES[_position][_step] = _ray
+
+RAY_BITS = {step: [_squaresToBits(RAY_SQUARES[i][step]) for i in range(64)] for step in DIRECTIONS}
+
+DIAGONAL_BITS = [RAY_BITS[-9][i] | RAY_BITS[9][i] for i in range(64)]
+ANTI_DIAGONAL_BITS = [RAY_BITS[-7][i] | RAY_BITS[7][i] for i in range(64)]
+RANK_BITS = [RAY_BITS[-1][i] | RAY_BITS[1][i] for i in range(64)]
+FILE_BITS = [RAY_BITS[-8][i] | RAY_BITS[8][i] for i in range(64)]
+ROOK_ATTACK_BITS = [RANK_BITS[i] | FILE_BITS[i] for i in range(64)]
+BISHOP_ATTACK_BITS = [DIAGONAL_BITS[i] | ANTI_DIAGONAL_BITS[i] for i in range(64)]
+QUEEN_ATTACK_BITS = [ROOK_ATTACK_BITS[i] | BISHOP_ATTACK_BITS[i] for i in range(64)]
+
+KING_ATTACK_BITS = [_squaresToBits(ray[0] for ray in RAY_SQUARES[i].values() if ray) for i in range(64)]
+KNIGHT_ATTACK_BITS = [_squaresToBits(sq for sq in (_offsetSquare(i, f, r) for f, r in KNIGHT_OFFSETS) if sq != -1) for i in range(64)]
+# Squares attacked by a pawn of each colour standing on each square, indexed by colour then square
+PAWN_ATTACK_BITS = [None, None]
+PAWN_ATTACK_BITS[colour.WHITE] = [_squaresToBits(sq for sq in (_offsetSquare(i, -1, 1), _offsetSquare(i, 1, 1)) if sq != -1) for i in range(64)]
+PAWN_ATTACK_BITS[colour.BLACK] = [_squaresToBits(sq for sq in (_offsetSquare(i, -1, -1), _offsetSquare(i, 1, -1)) if sq != -1) for i in range(64)]
+
+# Every square of the board
+ALL_BITS = (1 << 64) - 1
+
+# Every square of each file, indexed by file rather than by square
+FULL_FILE_BITS = [0x0101010101010101 << file for file in range(8)]
+# Every square of each rank, indexed by rank
+FULL_RANK_BITS = [0xFF << 8*rank for rank in range(8)]
+
+# Squares strictly between two squares, and the whole line through them, for squares sharing a rank, file or diagonal
+BETWEEN_BITS = [[0]*64 for _ in range(64)]
+LINE_BITS = [[0]*64 for _ in range(64)]
+for _position in range(64):
+    for _step, _ray in RAY_SQUARES[_position].items():
+        _line = RAY_BITS[_step][_position] | RAY_BITS[-_step][_position] | 1 << _position
+        _between = 0
+        for _square in _ray:
+            BETWEEN_BITS[_position][_square] = _between
+            LINE_BITS[_position][_square] = _line
+            _between |= 1 << _square
+
+# bitarray copies of the tables above. They are shared between callers and must not be modified in place.
+DIAGONAL_MASKS = [bitsToMask(bits) for bits in DIAGONAL_BITS]
+ANTI_DIAGONAL_MASKS = [bitsToMask(bits) for bits in ANTI_DIAGONAL_BITS]
+RANK_MASKS = [bitsToMask(bits) for bits in RANK_BITS]
+FILE_MASKS = [bitsToMask(bits) for bits in FILE_BITS]
+ROOK_ATTACK_MASKS = [bitsToMask(bits) for bits in ROOK_ATTACK_BITS]
+BISHOP_ATTACK_MASKS = [bitsToMask(bits) for bits in BISHOP_ATTACK_BITS]
+QUEEN_ATTACK_MASKS = [bitsToMask(bits) for bits in QUEEN_ATTACK_BITS]
+KING_ATTACK_MASKS = [bitsToMask(bits) for bits in KING_ATTACK_BITS]
+KNIGHT_ATTACK_MASKS = [bitsToMask(bits) for bits in KNIGHT_ATTACK_BITS]
+PAWN_ATTACK_MASKS = [[bitsToMask(bits) for bits in table] for table in PAWN_ATTACK_BITS]
+RAY_MASKS = {step: [bitsToMask(bits) for bits in table] for step, table in RAY_BITS.items()}
+FULL_FILE_MASKS = [bitsToMask(bits) for bits in FULL_FILE_BITS]
+BETWEEN_MASKS = [[bitsToMask(bits) for bits in row] for row in BETWEEN_BITS]
+LINE_MASKS = [[bitsToMask(bits) for bits in row] for row in LINE_BITS]
+
+def northMask(position: int):
+    return RAY_MASKS[8][position]
+
 def southMask(position: int):
-    result = result = bitarray('0000000100000001000000010000000100000001000000010000000100000000') << (63-position)
-    return result
+    return RAY_MASKS[-8][position]
 
 def fileMask(position: int):
-    result = bitarray('1000000010000000100000001000000010000000100000001000000010000000') >> (position&7)
-    result[position] = 0
-    return result
+    return FILE_MASKS[position]
 
 def rankMask(position: int):
-    result = bitarray('1111111100000000000000000000000000000000000000000000000000000000') >> (position&56)
-    result[position] = 0
-    return result
+    return RANK_MASKS[position]
 
 def antiDiagonalMask(position: int):
-    result = bitarray('0000000100000010000001000000100000010000001000000100000010000000')
-    diag = 56-8*(position&7) - (position & 56)
-    nort = -diag & ( diag >> 31)
-    sout =  diag & (-diag >> 31)
-    result = (result << sout) >> nort
-    result[position] = 0
-    return result
+    return ANTI_DIAGONAL_MASKS[position]
 
 def diagonalMask(position: int):
-    result = bitarray('1000000001000000001000000001000000001000000001000000001000000001')
-    diag = 8*(position&7) - (position & 56)
-    nort = -diag & ( diag >> 31)
-    sout =  diag & (-diag >> 31)
-    result = (result << sout) >> nort
-    result[position] = 0
-    return result
-
-def rankMask(position: int):
-    result = bitarray('1111111100000000000000000000000000000000000000000000000000000000') >> (position&56)
-    result[position] = 0
-    return result
+    return DIAGONAL_MASKS[position]
 
 def queenAttackMask(position: int):
-    return rankMask(position) | fileMask(position) | diagonalMask(position) | antiDiagonalMask(position)
+    return QUEEN_ATTACK_MASKS[position]
 
 def rookAttackMask(position: int):
-    return rankMask(position) | fileMask(position)
+    return ROOK_ATTACK_MASKS[position]
 
 def bishopAttackMask(position: int):
-    return diagonalMask(position) | antiDiagonalMask(position)
+    return BISHOP_ATTACK_MASKS[position]
 
 def kingAttackMask(position: int):
-    result = bitarray('0000000000000000000000000000000000000000000000000000000000000000')
-    if position // 8 < 7:
-        if position % 8 > 0:
-            result[position+7] = True
-        if position % 8 < 7:
-            result[position+9] = True
-        result[position+8] = True
-    if position // 8 > 0:
-        if position % 8 > 0:
-            result[position-9] = True
-        if position % 8 < 7:
-            result[position-7] = True
-        result[position-8] = True
-    if position % 8 > 0:
-        result[position-1] = True
-    if position % 8 < 7:
-        result[position+1] = True
-    return result
+    return KING_ATTACK_MASKS[position]
+
+def knightAttackMask(position: int):
+    return KNIGHT_ATTACK_MASKS[position]
+
+def pawnAttackMask(position: int, col):
+    return PAWN_ATTACK_MASKS[col][position]
+
+def betweenMask(start: int, end: int):
+    return BETWEEN_MASKS[start][end]
+
+def lineMask(start: int, end: int):
+    return LINE_MASKS[start][end]
 
 def bitMaskString(bits):
     result = ''
@@ -93,9 +160,17 @@ def bitMaskString(bits):
         result += '\n'
     return result
 
-def moveToAlgebraic(move: tuple[int, int, int]):
-    if move[2] >= 8:
-        algebraic_move = indexToPos(move[0])+indexToPos(move[1])+["n", "b", "r", "q"][move[2]%4]
+# Moves are packed into 16 bits: start square in bits 0-5, end square in bits 6-11 and the move code in bits 12-15
+def encodeMove(startPos: int, endPos: int, code: int) -> int:
+    return startPos | endPos << 6 | code << 12
+
+def decodeMove(move: int) -> tuple[int, int, int]:
+    return move & 63, move >> 6 & 63, move >> 12
+
+def moveToAlgebraic(move: int):
+    (startPos, endPos, code) = decodeMove(move)
+    if code >= 8:
+        algebraic_move = indexToPos(startPos)+indexToPos(endPos)+["n", "b", "r", "q"][code%4]
     else:
-        algebraic_move = indexToPos(move[0])+indexToPos(move[1])
+        algebraic_move = indexToPos(startPos)+indexToPos(endPos)
     return algebraic_move
\ No newline at end of file
@@ -1,8 +1,10 @@
 from bitarray import bitarray
-import copy
+from array import array
 import colour
+import undorecord
 from bitarray_masks import *
-import piece
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, NO_PAWNS_KEY
+from slider_attacks import rookAttacks, bishopAttacks, queenAttacks
 
 
 class Board:
@@ -11,35 +13,9 @@ class Board:
         if not orig and not FEN:
             FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
-        if FEN:
-            self.whitePawns = bitarray(64)
-            self.whiteKnights = bitarray(64)
-            self.whiteBishops = bitarray(64)
-            self.whiteRooks = bitarray(64)
-            self.whiteQueens = bitarray(64)
-            self.whiteKing = bitarray(64)
-
-            self.blackPawns = bitarray(64)
-            self.blackKnights = bitarray(64)
-            self.blackBishops = bitarray(64)
-            self.blackRooks = bitarray(64)
-            self.blackQueens = bitarray(64)
-            self.blackKing = bitarray(64)
-
-            self.whitePawns.setall(0)
-            self.whiteKnights.setall(0)
-            self.whiteBishops.setall(0)
-            self.whiteRooks.setall(0)
-            self.whiteQueens.setall(0)
-            self.whiteKing.setall(0)
-
-            self.blackPawns.setall(0)
-            self.blackKnights.setall(0)
-            self.blackBishops.setall(0)
-            self.blackRooks.setall(0)
-            self.blackQueens.setall(0)
-            self.blackKing.setall(0)
+        self.clearPieces()
 
+        if FEN:
             fields = FEN.split()
 
             ranks = fields[0].split('/')
@@ -48,124 +24,171 @@ class Board:
             for i, rank in enumerate(ranks):
                 file = 0
                 for char in rank:
-                    if char == 'P':
-                        self.whitePawns[i*8+file] = True
-                    elif char == 'N':
-                        self.whiteKnights[i*8+file] = True
-                    elif char == 'B':
-                        self.whiteBishops[i*8+file] = True
-                    elif char == 'R':
-                        self.whiteRooks[i*8+file] = True
-                    elif char == 'Q':
-                        self.whiteQueens[i*8+file] = True
-                    elif char == 'K':
-                        self.whiteKing[i*8+file] = True
-                    elif char == 'p':
-                        self.blackPawns[i*8+file] = True
-                    elif char == 'n':
-                        self.blackKnights[i*8+file] = True
-                    elif char == 'b':
-                        self.blackBishops[i*8+file] = True
-                    elif char == 'r':
-                        self.blackRooks[i*8+file] = True
-                    elif char == 'q':
-                        self.blackQueens[i*8+file] = True
-                    elif char == 'k':
-                        self.blackKing[i*8+file] = True
+                    if char in self.PIECE_SETS:
+                        self.putPiece(char, i*8+file)
                     else:
                         file += int(char)-1
                     file += 1
 
-            self.whitePieces = self.whitePawns | self.whiteKnights | self.whiteBishops | self.whiteRooks | self.whiteQueens | self.whiteKing
-            self.blackPieces = self.blackPawns | self.blackKnights | self.blackBishops | self.blackRooks | self.blackQueens | self.blackKing
-            self.pieces = self.blackPieces | self.whitePieces
-
             if fields[1] == 'w':
-                self.toPlay = colour.Colour.WHITE
+                self.toPlay = colour.WHITE
             else:
-                self.toPlay = colour.Colour.BLACK
+                self.toPlay = colour.BLACK
             
-            # KQkq (white can castle kingside, queenside, black can castle kingside queenside)
-            self.castlingRights = set()
-            for char in fields[2]:
-                if char != '-':
-                    self.castlingRights.add(char)
+            # KQkq (white can castle kingside, queenside, black can castle kingside queenside) as bits 0-3
+            self.castlingRights = 0
+            for i, right in enumerate(self.CASTLING_RIGHTS):
+                if right in fields[2]:
+                    self.castlingRights |= 1 << i
 
-            # Square over which a pawn has just passed while moving two squares
-            self.enPassant = fields[3]
+            # Square over which a pawn has just passed while moving two squares, or -1
+            self.enPassant = posToIndex(fields[3])
 
             # Number of halfmoves since last capture or pawn advance (for fifty-move rule)
             self.halfMoveClock = int(fields[4])
 
-            # Previous states for unmake move
-            self.prevHalfMoveClock = []
-            self.prevCapture = []
-            self.prevCastlingRights = []
-            self.prevEPs = []
+            # Undo records of the moves played so far, reused so that make/unmake allocate nothing
+            self.undoStack = [undorecord.UndoRecord() for _ in range(self.UNDO_STACK_SIZE)]
+            self.ply = 0
 
             # Number of full moves (starts at 1 and increments after blacks move)
             self.fullMoves = int(fields[5])
 
-            
+            self.hash = self.computeHash()
+            self.pawnHash = self.computePawnHash()
 
         elif orig:
-            self.whitePawns = copy.copy(orig.whitePawns)
-            self.whiteKnights = copy.copy(orig.whiteKnights)
-            self.whiteBishops = copy.copy(orig.whiteBishops)
-            self.whiteRooks = copy.copy(orig.whiteRooks)
-            self.whiteQueens = copy.copy(orig.whiteQueens)
-            self.whiteKing = copy.copy(orig.whiteKing)
-
-            self.blackPawns = copy.copy(orig.blackPawns)
-            self.blackKnights = copy.copy(orig.blackKnights)
-            self.blackBishops = copy.copy(orig.blackBishops)
-            self.blackRooks = copy.copy(orig.blackRooks)
-            self.blackQueens = copy.copy(orig.blackQueens)
-            self.blackKing = copy.copy(orig.blackKing)
-
-            self.whitePieces = self.whitePawns | self.whiteKnights | self.whiteBishops | self.whiteRooks | self.whiteQueens | self.whiteKing
-            self.blackPieces = self.blackPawns | self.blackKnights | self.blackBishops | self.blackRooks | self.blackQueens | self.blackKing
-            self.pieces = self.blackPieces | self.whitePieces
+            for position, char in enumerate(orig.mailbox):
+                if char:
+                    self.putPiece(char, position)
 
             self.toPlay = orig.toPlay
-            self.castlingRights = copy.copy(orig.castlingRights)
+            self.castlingRights = orig.castlingRights
             self.enPassant = orig.enPassant
             self.halfMoveClock = orig.halfMoveClock
-            self.prevHalfMoveClock = orig.prevHalfMoveClock
-            self.prevCapture = orig.prevCapture
-            self.prevCastlingRights = copy.copy(orig.prevCastlingRights)
-            self.prevEPs = orig.prevEPs
+            self.undoStack = [undorecord.UndoRecord() for _ in range(len(orig.undoStack))]
+            for record, origRecord in zip(self.undoStack, orig.undoStack[:orig.ply]):
+                record.captured = origRecord.captured
+                record.castlingRights = origRecord.castlingRights
+                record.enPassant = origRecord.enPassant
+                record.halfMoveClock = origRecord.halfMoveClock
+                record.hash = origRecord.hash
+                record.pawnHash = origRecord.pawnHash
+            self.ply = orig.ply
             self.fullMoves = orig.fullMoves
-            self.transpositionTable = copy.copy(orig.transpositionTable)
+            self.hash = orig.hash
+            self.pawnHash = orig.pawnHash
+
+    UNDO_STACK_SIZE = 256
+
+    CASTLING_RIGHTS = 'KQkq'
+    WHITE_KINGSIDE = 1
+    WHITE_QUEENSIDE = 2
+    BLACK_KINGSIDE = 4
+    BLACK_QUEENSIDE = 8
+
+    PIECE_SETS = {'P': 'whitePawns', 'N': 'whiteKnights', 'B': 'whiteBishops', 'R': 'whiteRooks', 'Q': 'whiteQueens', 'K': 'whiteKing',
+                  'p': 'blackPawns', 'n': 'blackKnights', 'b': 'blackBishops', 'r': 'blackRooks', 'q': 'blackQueens', 'k': 'blackKing'}
+
+    PIECE_SYMBOLS = {'P': '♟︎', 'N': '♞', 'B': '♝', 'R': '♜', 'Q': '♛', 'K': '♚',
+                     'p': '♙', 'n': '♘', 'b': '♗', 'r': '♖', 'q': '♕', 'k': '♔'}
+
+    # Empty piece sets, plus the mailbox (FEN character of the piece on each square, None if empty)
+    # and the number of pieces of each kind and colour, all kept up to date by make/unmake
+    def clearPieces(self):
+        self.pieceSets = {}
+        for char, name in self.PIECE_SETS.items():
+            bits = bitarray(64)
+            bits.setall(0)
+            setattr(self, name, bits)
+            # The same bitarray objects, looked up by FEN character
+            self.pieceSets[char] = bits
+        self.whitePieces = bitarray(64)
+        self.whitePieces.setall(0)
+        self.blackPieces = bitarray(64)
+        self.blackPieces.setall(0)
+        self.pieces = bitarray(64)
+        self.pieces.setall(0)
+
+        self.mailbox = [None] * 64
+        self.pieceCounts = {char: 0 for char in self.PIECE_SETS}
+
+    def putPiece(self, char, position: int):
+        self.pieceSets[char][position] = True
+        if char.isupper():
+            self.whitePieces[position] = True
+        else:
+            self.blackPieces[position] = True
+        self.pieces[position] = True
+        self.mailbox[position] = char
+        self.pieceCounts[char] += 1
+
+    def removePiece(self, char, position: int):
+        self.pieceSets[char][position] = False
+        if char.isupper():
+            self.whitePieces[position] = False
+        else:
+            self.blackPieces[position] = False
+        self.pieces[position] = False
+        self.mailbox[position] = None
+        self.pieceCounts[char] -= 1
+
+    def movePiece(self, char, startPos: int, endPos: int):
+        bits = self.pieceSets[char]
+        bits[startPos] = False
+        bits[endPos] = True
+        if char.isupper():
+            bits = self.whitePieces
+        else:
+            bits = self.blackPieces
+        bits[startPos] = False
+        bits[endPos] = True
+        self.pieces[startPos] = False
+        self.pieces[endPos] = True
+        self.mailbox[startPos] = None
+        self.mailbox[endPos] = char
+
+    @staticmethod
+    def popCount(bits) -> int:
+        return bits.count()
+
+    @staticmethod
+    def testBit(bits, position: int) -> bool:
+        return bits[position]
+
+    # Piece set as an int with square i at bit i, for the attack tables
+    @staticmethod
+    def toBits(bits) -> int:
+        return maskToBits(bits)
+
+    @staticmethod
+    def setSquares(bits):
+        return bits.search(1)
+
+    @staticmethod
+    def fileBits(file: int):
+        return FULL_FILE_MASKS[file]
+
+    @staticmethod
+    def kingAttackBits(position: int):
+        return KING_ATTACK_MASKS[position]
+
+    # FEN character of the piece on a square, or None if it is empty
+    def pieceAt(self, position: int):
+        return self.mailbox[position]
+
+    def kingSquare(self, col) -> int:
+        if col == colour.WHITE:
+            return self.whiteKing.index(1)
+        return self.blackKing.index(1)
 
     def getString(self):
         result = ''
         for i in range(7,-1,-1):
             for j in range(8):
-                if self.whitePawns[i*8+j]:
-                    result += '♟︎'
-                elif self.whiteKnights[i*8+j]:
-                    result += '♞'
-                elif self.whiteBishops[i*8+j]:
-                    result += '♝'
-                elif self.whiteRooks[i*8+j]:
-                    result += '♜'
-                elif self.whiteQueens[i*8+j]:
-                    result += '♛'
-                elif self.whiteKing[i*8+j]:
-                    result += '♚'
-                elif self.blackPawns[i*8+j]:
-                    result += '♙'
-                elif self.blackKnights[i*8+j]:
-                    result += '♘'
-                elif self.blackBishops[i*8+j]:
-                    result += '♗'
-                elif self.blackRooks[i*8+j]:
-                    result += '♖'
-                elif self.blackQueens[i*8+j]:
-                    result += '♕'
-                elif self.blackKing[i*8+j]:
-                    result += '♔'
+                char = self.mailbox[i*8+j]
+                if char:
+                    result += self.PIECE_SYMBOLS[char]
                 else:
                     result += '.'
             result += '\n'
@@ -176,91 +199,35 @@ class Board:
         for i in range(7,-1,-1):
             gaps = 0
             for j in range(8):
-                if not(self.whitePieces[i*8+j] | self.blackPieces[i*8+j]):
+                char = self.mailbox[i*8+j]
+                if not char:
                     gaps += 1
-                elif self.whitePawns[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'P'
-                elif self.whiteKnights[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'N'
-                elif self.whiteBishops[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'B'
-                elif self.whiteRooks[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'R'
-                elif self.whiteQueens[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'Q'
-                elif self.whiteKing[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'K'
-                elif self.blackPawns[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'p'
-                elif self.blackKnights[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'n'
-                elif self.blackBishops[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'b'
-                elif self.blackRooks[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'r'
-                elif self.blackQueens[i*8+j]:
-                    if gaps != 0:
-                        result += str(gaps)
-                        gaps = 0
-                    result += 'q'
-                elif self.blackKing[i*8+j]:
+                else:
                     if gaps != 0:
                         result += str(gaps)
                         gaps = 0
-                    result += 'k'
+                    result += char
             if gaps != 0:
                 result += str(gaps)
             if i != 0:
                 result += '/'
         
         result += ' '
-        if self.toPlay == colour.Colour.WHITE:
+        if self.toPlay == colour.WHITE:
             result += 'w'
         else:
             result += 'b'
         
         result += ' '
-        if len(self.castlingRights) == 0:
+        if self.castlingRights == 0:
             result += '-'
         else:
-            for item in self.castlingRights:
-                result += item
+            for i, right in enumerate(self.CASTLING_RIGHTS):
+                if self.castlingRights >> i & 1:
+                    result += right
         
         result += ' '
-        if self.enPassant != '':
-            result += self.enPassant
-        else:
-            result += '-'
+        result += indexToPos(self.enPassant)
 
         result += ' '
         result += str(self.halfMoveClock)
@@ -270,961 +237,593 @@ class Board:
 
         return result
 
-    def generatePseudoLegalMoves(self) -> list[tuple[int, int, int]]:
+    # Moves are packed into 16 bits (see encodeMove) and returned as an array('H'), captures and promotions first.
+    # Loud moves are captures and promotions, quiet moves all the others; either kind can be left out.
+    def generatePseudoLegalMoves(self, loud=True, quiet=True) -> array:
+        targets = self.moveTargets(loud, quiet)
         moves = []
-        moves.extend(self.generatePseudoLegalPawnMoves())
-        moves.extend(self.generatePseudoLegalKnightMoves())
-        moves.extend(self.generatePseudoLegalKingMoves())
-        moves.extend(self.generatePseudoLegalRookMoves())
-        moves.extend(self.generatePseudoLegalBishopMoves())
-        moves.extend(self.generatePseudoLegalQueenMoves())
-        moves.sort(key=lambda move: move[2], reverse=True)
-        return moves
+        moves.extend(self.generatePseudoLegalPawnMoves(loud, quiet))
+        moves.extend(self.generatePseudoLegalKnightMoves(targets))
+        moves.extend(self.generatePseudoLegalKingMoves(targets, quiet))
+        moves.extend(self.generatePseudoLegalRookMoves(targets))
+        moves.extend(self.generatePseudoLegalBishopMoves(targets))
+        moves.extend(self.generatePseudoLegalQueenMoves(targets))
+        # The move code is in the top bits, so sorting the packed moves sorts them by code
+        moves.sort(reverse=True)
+        return array('H', moves)
     
-    def generatePseudoLegalRookMoves(self) -> list[tuple[int,int,int]]:
-        moves = []
-        for position in range(64):
-            if self.toPlay == colour.Colour.WHITE and self.whiteRooks[position]:
-                endPos = position-1
-                while endPos % 8 != 7 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 1
-                if endPos % 8 != 7 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+1
-                while endPos % 8 != 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 1
-                if endPos % 8 != 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-8
-                while endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 8
-                if endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+8
-                while endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 8
-                if endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-            if self.toPlay == colour.Colour.BLACK and self.blackRooks[position]:
-                endPos = position-1
-                while endPos % 8 != 7 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 1
-                if endPos % 8 != 7 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+1
-                while endPos % 8 != 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 1
-                if endPos % 8 != 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-8
-                while endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 8
-                if endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+8
-                while endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 8
-                if endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-        return moves
+    # Squares pieces other than pawns may move to: enemy pieces for loud moves, empty squares for quiet ones
+    def moveTargets(self, loud=True, quiet=True) -> int:
+        targets = 0
+        if loud:
+            targets |= self.toBits(self.colourPieces(self.toPlay ^ 1))
+        if quiet:
+            targets |= ~self.toBits(self.pieces) & ALL_BITS
+        return targets
+
+    def generatePseudoLegalRookMoves(self, targets=ALL_BITS) -> list[int]:
+        return self.generateSlidingMoves(self.piecesOf(self.toPlay, 'R'), rookAttacks, targets)
     
-    def generatePseudoLegalBishopMoves(self) -> list[tuple[int,int,int]]:
-        moves = []
-        for position in range(64):
-            if self.toPlay == colour.Colour.WHITE and self.whiteBishops[position]:
-                endPos = position-9
-                while endPos % 8 != 7 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 9
-                if endPos % 8 != 7 and endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-7
-                while endPos % 8 != 0 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 7
-                if endPos % 8 != 0 and endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+7
-                while endPos % 8 != 7 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 7
-                if endPos % 8 != 7 and endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+9
-                while endPos % 8 != 0 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 9
-                if endPos % 8 != 0 and endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-                
-
-            if self.toPlay == colour.Colour.BLACK and self.blackBishops[position]:
-                endPos = position-9
-                while endPos % 8 != 7 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 9
-                if endPos % 8 != 7 and endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-7
-                while endPos % 8 != 0 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 7
-                if endPos % 8 != 0 and endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+7
-                while endPos % 8 != 7 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 7
-                if endPos % 8 != 7 and endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+9
-                while endPos % 8 != 0 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 9
-                if endPos % 8 != 0 and endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-        return moves
+    def generatePseudoLegalBishopMoves(self, targets=ALL_BITS) -> list[int]:
+        return self.generateSlidingMoves(self.piecesOf(self.toPlay, 'B'), bishopAttacks, targets)
     
-    def generatePseudoLegalQueenMoves(self) -> list[tuple[int,int,int]]:
+    def generatePseudoLegalQueenMoves(self, targets=ALL_BITS) -> list[int]:
+        return self.generateSlidingMoves(self.piecesOf(self.toPlay, 'Q'), queenAttacks, targets)
+
+    def generateSlidingMoves(self, sliders, attacks, targets=ALL_BITS) -> list[int]:
         moves = []
-        for position in range(64):
-            if self.toPlay == colour.Colour.WHITE and self.whiteQueens[position]:
-                endPos = position-9
-                while endPos % 8 != 7 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 9
-                if endPos % 8 != 7 and endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-7
-                while endPos % 8 != 0 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 7
-                if endPos % 8 != 0 and endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+7
-                while endPos % 8 != 7 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 7
-                if endPos % 8 != 7 and endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+9
-                while endPos % 8 != 0 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 9
-                if endPos % 8 != 0 and endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-                
-                endPos = position-1
-                while endPos % 8 != 7 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 1
-                if endPos % 8 != 7 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+1
-                while endPos % 8 != 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 1
-                if endPos % 8 != 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-8
-                while endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 8
-                if endPos // 8 >= 0 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+8
-                while endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 8
-                if endPos // 8 != 8 and self.blackPieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-            if self.toPlay == colour.Colour.BLACK and self.blackQueens[position]:
-                endPos = position-9
-                while endPos % 8 != 7 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 9
-                if endPos % 8 != 7 and endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-7
-                while endPos % 8 != 0 and endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 7
-                if endPos % 8 != 0 and endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+7
-                while endPos % 8 != 7 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 7
-                if endPos % 8 != 7 and endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+9
-                while endPos % 8 != 0 and endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 9
-                if endPos % 8 != 0 and endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-                
-                endPos = position-1
-                while endPos % 8 != 7 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 1
-                if endPos % 8 != 7 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+1
-                while endPos % 8 != 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 1
-                if endPos % 8 != 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position-8
-                while endPos // 8 >= 0 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos -= 8
-                if endPos // 8 >= 0 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
-
-                endPos = position+8
-                while endPos // 8 != 8 and not self.pieces[endPos]:
-                    moves.append((position, endPos, 0))
-                    endPos += 8
-                if endPos // 8 != 8 and self.whitePieces[endPos]:
-                    moves.append((position, endPos, 4))
+        occupancy = self.toBits(self.pieces)
+        targets &= ~self.toBits(self.colourPieces(self.toPlay))
+        enemyBits = self.toBits(self.colourPieces(self.toPlay ^ 1))
+        for position in self.setSquares(sliders):
+            for endPos in bitSquares(attacks(position, occupancy) & targets):
+                moves.append(position | endPos << 6 | 4*(enemyBits >> endPos & 1) << 12)
         return moves
 
-    def generatePseudoLegalKingMoves(self) -> list[tuple[int, int, int]]:
+    # Piece set of one kind ('P', 'N', 'B', 'R', 'Q' or 'K') for a colour
+    def piecesOf(self, col, kind: str):
+        if col == colour.WHITE:
+            return getattr(self, self.PIECE_SETS[kind])
+        return getattr(self, self.PIECE_SETS[kind.lower()])
+
+    def colourPieces(self, col):
+        if col == colour.WHITE:
+            return self.whitePieces
+        return self.blackPieces
+
+    # Number of squares the knights, bishops, rooks and queens of a colour can move to
+    def mobility(self, col) -> int:
+        occupancy = self.toBits(self.pieces)
+        notOwn = ~self.toBits(self.colourPieces(col))
+        count = 0
+        for position in self.setSquares(self.piecesOf(col, 'N')):
+            count += (KNIGHT_ATTACK_BITS[position] & notOwn).bit_count()
+        for position in self.setSquares(self.piecesOf(col, 'B')):
+            count += (bishopAttacks(position, occupancy) & notOwn).bit_count()
+        for position in self.setSquares(self.piecesOf(col, 'R')):
+            count += (rookAttacks(position, occupancy) & notOwn).bit_count()
+        for position in self.setSquares(self.piecesOf(col, 'Q')):
+            count += (queenAttacks(position, occupancy) & notOwn).bit_count()
+        return count
+
+    def generatePseudoLegalKingMoves(self, targets=ALL_BITS, castling=True) -> list[int]:
         moves = []
-        if self.toPlay == colour.Colour.WHITE:
-            position = self.whiteKing.index(1)
-            if position // 8 < 7:
-                if position % 8 > 0 and not self.whitePieces[position+7]:
-                    moves.append((position, position+7, 4*self.blackPieces[position+7]))
-                if position % 8 < 7 and not self.whitePieces[position+9]:
-                    moves.append((position, position+9, 4*self.blackPieces[position+9]))
-                if not self.whitePieces[position+8]:
-                    moves.append((position, position+8, 4*self.blackPieces[position+8]))
-            if position // 8 > 0:
-                if position % 8 > 0 and not self.whitePieces[position-9]:
-                    moves.append((position, position-9, 4*self.blackPieces[position-9]))
-                if position % 8 < 7 and not self.whitePieces[position-7]:
-                    moves.append((position, position-7, 4*self.blackPieces[position-7]))
-                if not self.whitePieces[position-8]:
-                    moves.append((position, position-8, 4*self.blackPieces[position-8]))
-            if position % 8 > 0 and not self.whitePieces[position-1]:
-                moves.append((position, position-1, 4*self.blackPieces[position-1]))
-            if position % 8 < 7 and not self.whitePieces[position+1]:
-                moves.append((position, position+1, 4*self.blackPieces[position+1]))
-            if 'K' in self.castlingRights and not self.pieces[5:7].any():
-                moves.append((4, 6, 2))
-            if 'Q' in self.castlingRights and not self.pieces[1:4].any():
-                moves.append((4, 2, 3))
-        elif self.toPlay == colour.Colour.BLACK:
-            position = self.blackKing.index(1)
-            if position // 8 < 7:
-                if position % 8 > 0 and not self.blackPieces[position+7]:
-                    moves.append((position, position+7, 4*self.whitePieces[position+7]))
-                if position % 8 < 7 and not self.blackPieces[position+9]:
-                    moves.append((position, position+9, 4*self.whitePieces[position+9]))
-                if not self.blackPieces[position+8]:
-                    moves.append((position, position+8, 4*self.whitePieces[position+8]))
-            if position // 8 > 0:
-                if position % 8 > 0 and not self.blackPieces[position-9]:
-                    moves.append((position, position-9, 4*self.whitePieces[position-9]))
-                if position % 8 < 7 and not self.blackPieces[position-7]:
-                    moves.append((position, position-7, 4*self.whitePieces[position-7]))
-                if not self.blackPieces[position-8]:
-                    moves.append((position, position-8, 4*self.whitePieces[position-8]))
-            if position % 8 > 0 and not self.blackPieces[position-1]:
-                moves.append((position, position-1, 4*self.whitePieces[position-1]))
-            if position % 8 < 7 and not self.blackPieces[position+1]:
-                moves.append((position, position+1, 4*self.whitePieces[position+1]))
-            if 'k' in self.castlingRights and not self.pieces[61:63].any():
-                moves.append((60, 62, 2))
-            if 'q' in self.castlingRights and not self.pieces[57:60].any():
-                moves.append((60, 58, 3))
-
+        us = self.toPlay
+        position = self.kingSquare(us)
+        occupancy = self.toBits(self.pieces)
+        enemyBits = self.toBits(self.colourPieces(us ^ 1))
+        for endPos in bitSquares(KING_ATTACK_BITS[position] & targets & ~self.toBits(self.colourPieces(us))):
+            moves.append(position | endPos << 6 | 4*(enemyBits >> endPos & 1) << 12)
+        if not castling:
+            return moves
+        # Black's castling rights, squares and moves are white's shifted up to the eighth rank
+        rights = self.castlingRights >> 2*us
+        homeRank = 56*us
+        if rights & self.WHITE_KINGSIDE and not occupancy & 0x60 << homeRank:
+            moves.append(homeRank+4 | (homeRank+6) << 6 | 2 << 12)
+        if rights & self.WHITE_QUEENSIDE and not occupancy & 0xE << homeRank:
+            moves.append(homeRank+4 | (homeRank+2) << 6 | 3 << 12)
         return moves
 
-    def generatePseudoLegalKnightMoves(self) -> list[tuple[int, int, int]]:
+    def generatePseudoLegalKnightMoves(self, targets=ALL_BITS) -> list[int]:
         moves = []
-        for position in range(64):
-            if self.toPlay == colour.Colour.WHITE and self.whiteKnights[position]:
-                if position // 8 < 6:
-                    if position % 8 > 0 and not self.whitePieces[position+15]:
-                        moves.append((position, position+15, 4*self.blackPieces[position+15]))
-                    if position % 8 < 7 and not self.whitePieces[position+17]:
-                        moves.append((position, position+17, 4*self.blackPieces[position+17]))
-                if position // 8 < 7:
-                    if position % 8 > 1 and not self.whitePieces[position+6]:
-                        moves.append((position, position+6, 4*self.blackPieces[position+6]))
-                    if position % 8 < 6 and not self.whitePieces[position+10]:
-                        moves.append((position, position+10, 4*self.blackPieces[position+10]))
-                if position // 8 > 1:
-                    if position % 8 < 7 and not self.whitePieces[position-15]:
-                        moves.append((position, position-15, 4*self.blackPieces[position-15]))
-                    if position % 8 > 0 and not self.whitePieces[position-17]:
-                        moves.append((position, position-17, 4*self.blackPieces[position-17]))
-                if position // 8 > 0:
-                    if position % 8 < 6 and not self.whitePieces[position-6]:
-                        moves.append((position, position-6, 4*self.blackPieces[position-6]))
-                    if position % 8 > 1 and not self.whitePieces[position-10]:
-                        moves.append((position, position-10, 4*self.blackPieces[position-10]))
-
-            elif self.toPlay == colour.Colour.BLACK and self.blackKnights[position]:
-                if position // 8 < 6:
-                    if position % 8 > 0 and not self.blackPieces[position+15]:
-                        moves.append((position, position+15, 4*self.whitePieces[position+15]))
-                    if position % 8 < 7 and not self.blackPieces[position+17]:
-                        moves.append((position, position+17, 4*self.whitePieces[position+17]))
-                if position // 8 < 7:
-                    if position % 8 > 1 and not self.blackPieces[position+6]:
-                        moves.append((position, position+6, 4*self.whitePieces[position+6]))
-                    if position % 8 < 6 and not self.blackPieces[position+10]:
-                        moves.append((position, position+10, 4*self.whitePieces[position+10]))
-                if position // 8 > 1:
-                    if position % 8 < 7 and not self.blackPieces[position-15]:
-                        moves.append((position, position-15, 4*self.whitePieces[position-15]))
-                    if position % 8 > 0 and not self.blackPieces[position-17]:
-                        moves.append((position, position-17, 4*self.whitePieces[position-17]))
-                if position // 8 > 0:
-                    if position % 8 < 6 and not self.blackPieces[position-6]:
-                        moves.append((position, position-6, 4*self.whitePieces[position-6]))
-                    if position % 8 > 1 and not self.blackPieces[position-10]:
-                        moves.append((position, position-10, 4*self.whitePieces[position-10]))
+        targets &= ~self.toBits(self.colourPieces(self.toPlay))
+        enemyBits = self.toBits(self.colourPieces(self.toPlay ^ 1))
+        for position in self.setSquares(self.piecesOf(self.toPlay, 'N')):
+            for endPos in bitSquares(KNIGHT_ATTACK_BITS[position] & targets):
+                moves.append(position | endPos << 6 | 4*(enemyBits >> endPos & 1) << 12)
         return moves
 
-    def generatePseudoLegalPawnMoves(self) -> list[tuple[int, int, int]]:
+    def generatePseudoLegalPawnMoves(self, loud=True, quiet=True) -> list[int]:
         moves = []
-        for position in range(64):
-            if self.toPlay == colour.Colour.WHITE and self.whitePawns[position]:
-                if position // 8 < 6 and not self.pieces[position+8]:
-                    moves.append((position, position+8, 0))
-                    if position // 8 == 1 and not self.pieces[position+16]:
-                        moves.append((position, position+16, 1))
-                if position // 8 < 6 and self.blackPieces[position+7] and position % 8 != 0:
-                    moves.append((position, position+7, 4))
-                if position // 8 == 4 and posToIndex(self.enPassant) == position + 7 and position % 8 != 0:
-                    moves.append((position, position+7, 5))
-                if position // 8 < 6 and position % 8 != 7 and self.blackPieces[position+9]:
-                    moves.append((position, position+9, 4))
-                if position // 8 == 4 and posToIndex(self.enPassant) == position + 9 and position % 8 != 7:
-                    moves.append((position, position+9, 5))
-                if position // 8 == 6 and not self.pieces[position+8]:
-                    moves.append((position, position+8, 8))
-                    moves.append((position, position+8, 9))
-                    moves.append((position, position+8, 10))
-                    moves.append((position, position+8, 11))
-                if position // 8 == 6 and self.blackPieces[position+7] and position % 8 != 0:
-                    moves.append((position, position+7, 12))
-                    moves.append((position, position+7, 13))
-                    moves.append((position, position+7, 14))
-                    moves.append((position, position+7, 15))
-                if position // 8 == 6 and position % 8 != 7 and self.blackPieces[position+9] :
-                    moves.append((position, position+9, 12))
-                    moves.append((position, position+9, 13))
-                    moves.append((position, position+9, 14))
-                    moves.append((position, position+9, 15))
-
-            elif self.toPlay == colour.Colour.BLACK and self.blackPawns[position]:
-                if position // 8 > 1 and not self.pieces[position-8]:
-                    moves.append((position, position-8, 0))
-                    if position // 8 == 6 and not self.pieces[position-16]:
-                        moves.append((position, position-16, 1))
-                if position // 8 > 1 and self.whitePieces[position-7] and position % 8 != 7:
-                    moves.append((position, position-7, 4))
-                if position // 8 == 3 and posToIndex(self.enPassant) == position - 7 and position % 8 != 7:
-                    moves.append((position, position-7, 5))
-                if position // 8 > 1 and position % 8 != 0 and self.whitePieces[position-9]:
-                    moves.append((position, position-9, 4))
-                if position // 8 == 3 and posToIndex(self.enPassant) == position - 9 and position % 8 != 0:
-                    moves.append((position, position-9, 5))
-                if position // 8 == 1 and not self.pieces[position-8]:
-                    moves.append((position, position-8, 8))
-                    moves.append((position, position-8, 9))
-                    moves.append((position, position-8, 10))
-                    moves.append((position, position-8, 11))
-                if position // 8 == 1 and self.whitePieces[position-7] and position % 8 != 7:
-                    moves.append((position, position-7, 12))
-                    moves.append((position, position-7, 13))
-                    moves.append((position, position-7, 14))
-                    moves.append((position, position-7, 15))
-                if position // 8 == 1 and position % 8 != 0 and self.whitePieces[position-9]:
-                    moves.append((position, position-9, 12))
-                    moves.append((position, position-9, 13))
-                    moves.append((position, position-9, 14))
-                    moves.append((position, position-9, 15))
+        us = self.toPlay
+        pawns = self.toBits(self.piecesOf(us, 'P'))
+        empty = ~self.toBits(self.pieces)
+        enemyBits = self.toBits(self.colourPieces(us ^ 1))
+        # Targets of all the pawns at once; captures towards the a-file may not wrap round from the h-file and vice versa
+        if us == colour.WHITE:
+            forward = 8
+            pushes = pawns << 8 & empty
+            doublePushes = (pushes & FULL_RANK_BITS[2]) << 8 & empty
+            westCaptures = pawns << 7 & ~FULL_FILE_BITS[7] & enemyBits
+            eastCaptures = pawns << 9 & ~FULL_FILE_BITS[0] & enemyBits
+            lastRank = FULL_RANK_BITS[7]
+        else:
+            forward = -8
+            pushes = pawns >> 8 & empty
+            doublePushes = (pushes & FULL_RANK_BITS[5]) >> 8 & empty
+            westCaptures = pawns >> 9 & ~FULL_FILE_BITS[7] & enemyBits
+            eastCaptures = pawns >> 7 & ~FULL_FILE_BITS[0] & enemyBits
+            lastRank = FULL_RANK_BITS[0]
+
+        if quiet:
+            for endPos in bitSquares(pushes & ~lastRank):
+                moves.append(endPos-forward | endPos << 6)
+            for endPos in bitSquares(doublePushes):
+                moves.append(endPos-2*forward | endPos << 6 | 1 << 12)
+        if not loud:
+            return moves
+        for endPos in bitSquares(westCaptures & ~lastRank):
+            moves.append(endPos-forward+1 | endPos << 6 | 4 << 12)
+        for endPos in bitSquares(eastCaptures & ~lastRank):
+            moves.append(endPos-forward-1 | endPos << 6 | 4 << 12)
+        for endPos in bitSquares(pushes & lastRank):
+            moves.extend(endPos-forward | endPos << 6 | code << 12 for code in (8, 9, 10, 11))
+        for endPos in bitSquares(westCaptures & lastRank):
+            moves.extend(endPos-forward+1 | endPos << 6 | code << 12 for code in (12, 13, 14, 15))
+        for endPos in bitSquares(eastCaptures & lastRank):
+            moves.extend(endPos-forward-1 | endPos << 6 | code << 12 for code in (12, 13, 14, 15))
+        if self.enPassant != -1:
+            # Our pawns that could capture onto the square are those an enemy pawn there would attack
+            for position in bitSquares(PAWN_ATTACK_BITS[us ^ 1][self.enPassant] & pawns):
+                moves.append(position | self.enPassant << 6 | 5 << 12)
         return moves
 
-    def applyMove(self, move):
-        (startPos, endPos, code) = move
-        self.halfMoveClock += 1
-        if self.toPlay == colour.Colour.WHITE:
-            self.toPlay = colour.Colour.BLACK
-            if self.whitePawns[startPos]:
-                self.prevHalfMoveClock.append(self.halfMoveClock-1)
-                self.halfMoveClock = 0
-                self.whitePawns[startPos] = False
-                
-                if code == 5:
-                    self.blackPawns[endPos-8] = False
-                    self.prevCapture.append(piece.Piece.PAWN)
-
-                if code == 8 or code == 12:
-                    self.whiteKnights[endPos] = True
-                elif code == 9 or code == 13:
-                    self.whiteBishops[endPos] = True
-                elif code == 10 or code == 14:
-                    self.whiteRooks[endPos] = True
-                elif code == 11 or code == 15:
-                    self.whiteQueens[endPos] = True
-                else:
-                    self.whitePawns[endPos] = True
-
-            elif self.whiteKnights[startPos]:
-                self.whiteKnights[startPos] = False
-                self.whiteKnights[endPos] = True
-
-            elif self.whiteBishops[startPos]:
-                self.whiteBishops[startPos] = False
-                self.whiteBishops[endPos] = True
-
-            elif self.whiteRooks[startPos]:
-                self.whiteRooks[startPos] = False
-                self.whiteRooks[endPos] = True
-                if startPos == 0:
-                    self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                    self.castlingRights.discard('Q')
-                if startPos == 7:
-                    self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                    self.castlingRights.discard('K')
-
-            elif self.whiteQueens[startPos]:
-                self.whiteQueens[startPos] = False
-                self.whiteQueens[endPos] = True
-
-            elif self.whiteKing[startPos]:
-                self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                self.castlingRights.discard('K')
-                self.castlingRights.discard('Q')
-                self.whiteKing[startPos] = False
-                self.whiteKing[endPos] = True
-                if code == 2:
-                    self.whiteRooks[7] = False
-                    self.whiteRooks[5] = True
-                elif code == 3:
-                    self.whiteRooks[0] = False
-                    self.whiteRooks[3] = True
-            
-            self.prevEPs.append(self.enPassant)
-            if code == 1:
-                self.enPassant = indexToPos(startPos+8)
-            else:
-                self.enPassant = ''
-
-            if code in [4, 12, 13, 14, 15]:
-                self.prevHalfMoveClock.append(self.halfMoveClock-1)
-                self.halfMoveClock = 0
-                if self.blackBishops[endPos]:
-                    self.blackBishops[endPos] = False
-                    self.prevCapture.append(piece.Piece.BISHOP)
-                elif self.blackKing[endPos]:
-                    self.blackKing[endPos] = False
-                    self.prevCapture.append(piece.Piece.KING)
-                elif self.blackKnights[endPos]:
-                    self.blackKnights[endPos] = False
-                    self.prevCapture.append(piece.Piece.KNIGHT)
-                elif self.blackPawns[endPos]:
-                    self.blackPawns[endPos] = False
-                    self.prevCapture.append(piece.Piece.PAWN)
-                elif self.blackRooks[endPos]:
-                    self.blackRooks[endPos] = False
-                    self.prevCapture.append(piece.Piece.ROOK)
-                    if endPos == 56:
-                        self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                        self.castlingRights.discard('q')
-                    elif endPos == 63:
-                        self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                        self.castlingRights.discard('k')
-                elif self.blackQueens[endPos]:
-                    self.blackQueens[endPos] = False
-                    self.prevCapture.append(piece.Piece.QUEEN)
-
-        elif self.toPlay == colour.Colour.BLACK:
-            self.toPlay = colour.Colour.WHITE
+    # Castling rights kept when a piece moves from or to each square (a king or rook leaving home, or a rook captured there)
+    CASTLING_MASKS = [15] * 64
+    CASTLING_MASKS[0] = 15 & ~WHITE_QUEENSIDE
+    CASTLING_MASKS[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+    CASTLING_MASKS[7] = 15 & ~WHITE_KINGSIDE
+    CASTLING_MASKS[56] = 15 & ~BLACK_QUEENSIDE
+    CASTLING_MASKS[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+    CASTLING_MASKS[63] = 15 & ~BLACK_KINGSIDE
+
+    # White piece placed by each promotion code
+    PROMOTIONS = {8: 'N', 9: 'B', 10: 'R', 11: 'Q', 12: 'N', 13: 'B', 14: 'R', 15: 'Q'}
+
+    def applyMove(self, move: int):
+        startPos, endPos, code = move & 63, move >> 6 & 63, move >> 12
+        moved = self.mailbox[startPos]
+        captured = self.mailbox[endPos]
+
+        if self.ply == len(self.undoStack):
+            self.undoStack.append(undorecord.UndoRecord())
+        record = self.undoStack[self.ply]
+        self.ply += 1
+        record.castlingRights = self.castlingRights
+        record.enPassant = self.enPassant
+        record.halfMoveClock = self.halfMoveClock
+        record.hash = hash = self.hash
+        record.pawnHash = self.pawnHash
+
+        self.toPlay ^= 1
+        if self.toPlay == colour.WHITE:
             self.fullMoves += 1
-            if self.blackPawns[startPos]:
-                self.prevHalfMoveClock.append(self.halfMoveClock-1)
-                self.halfMoveClock = 0
-                self.blackPawns[startPos] = False
-                
-                if code == 5:
-                    self.whitePawns[endPos+8] = False
-                    self.prevCapture.append(piece.Piece.PAWN)
-
-                if code == 8 or code == 12:
-                    self.blackKnights[endPos] = True
-                elif code == 9 or code == 13:
-                    self.blackBishops[endPos] = True
-                elif code == 10 or code == 14:
-                    self.blackRooks[endPos] = True
-                elif code == 11 or code == 15:
-                    self.blackQueens[endPos] = True
-                else:
-                    self.blackPawns[endPos] = True
-
-            elif self.blackKnights[startPos]:
-                self.blackKnights[startPos] = False
-                self.blackKnights[endPos] = True
-
-            elif self.blackBishops[startPos]:
-                self.blackBishops[startPos] = False
-                self.blackBishops[endPos] = True
-
-            elif self.blackRooks[startPos]:
-                self.blackRooks[startPos] = False
-                self.blackRooks[endPos] = True
-                if startPos == 56:
-                    self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                    self.castlingRights.discard('q')
-                if startPos == 63:
-                    self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                    self.castlingRights.discard('k')
-
-            elif self.blackQueens[startPos]:
-                self.blackQueens[startPos] = False
-                self.blackQueens[endPos] = True
-
-            elif self.blackKing[startPos]:
-                self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                self.castlingRights.discard('k')
-                self.castlingRights.discard('q')
-                self.blackKing[startPos] = False
-                self.blackKing[endPos] = True
-                if code == 2:
-                    self.blackRooks[63] = False
-                    self.blackRooks[61] = True
-                elif code == 3:
-                    self.blackRooks[56] = False
-                    self.blackRooks[59] = True
-            
-            self.prevEPs.append(self.enPassant)
-            if code == 1:
-                self.enPassant = indexToPos(startPos-8)
+        hash ^= SIDE_KEY
+
+        if captured:
+            self.removePiece(captured, endPos)
+            hash ^= PIECE_KEYS[captured][endPos]
+            if captured == 'P' or captured == 'p':
+                self.pawnHash ^= PIECE_KEYS[captured][endPos]
+        elif code == 5:
+            # The captured pawn stands beside the start square, on the file of the end square
+            capturedPos = (startPos & 56) | (endPos & 7)
+            captured = self.mailbox[capturedPos]
+            self.removePiece(captured, capturedPos)
+            hash ^= PIECE_KEYS[captured][capturedPos]
+            self.pawnHash ^= PIECE_KEYS[captured][capturedPos]
+        record.captured = captured
+
+        if moved == 'P' or moved == 'p':
+            self.halfMoveClock = 0
+            # A promoted pawn leaves the pawn structure
+            if code >= 8:
+                self.pawnHash ^= PIECE_KEYS[moved][startPos]
             else:
-                self.enPassant = ''
-
-            if code in [4, 12, 13, 14, 15]:
-                self.prevHalfMoveClock.append(self.halfMoveClock-1)
-                self.halfMoveClock = 0
-                if self.whiteBishops[endPos]:
-                    self.whiteBishops[endPos] = False
-                    self.prevCapture.append(piece.Piece.BISHOP)
-                elif self.whiteKing[endPos]:
-                    self.whiteKing[endPos] = False
-                    self.prevCapture.append(piece.Piece.KING)
-                elif self.whiteKnights[endPos]:
-                    self.whiteKnights[endPos] = False
-                    self.prevCapture.append(piece.Piece.KNIGHT)
-                elif self.whitePawns[endPos]:
-                    self.whitePawns[endPos] = False
-                    self.prevCapture.append(piece.Piece.PAWN)
-                elif self.whiteRooks[endPos]:
-                    self.whiteRooks[endPos] = False
-                    self.prevCapture.append(piece.Piece.ROOK)
-                    if endPos == 0:
-                        self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                        self.castlingRights.discard('Q')
-                    elif endPos == 7:
-                        self.prevCastlingRights.append(copy.copy(self.castlingRights))
-                        self.castlingRights.discard('K')
-                elif self.whiteQueens[endPos]:
-                    self.whiteQueens[endPos] = False
-                    self.prevCapture.append(piece.Piece.QUEEN)       
-
-        self.whitePieces = self.whitePawns | self.whiteKnights | self.whiteBishops | self.whiteRooks | self.whiteQueens | self.whiteKing
-        self.blackPieces = self.blackPawns | self.blackKnights | self.blackBishops | self.blackRooks | self.blackQueens | self.blackKing
-        self.pieces = self.blackPieces | self.whitePieces
-
-    def unmake(self, move):
-        (startPos, endPos, code) = move
-        self.halfMoveClock -= 1
-        if self.toPlay == colour.Colour.BLACK:
-            self.toPlay = colour.Colour.WHITE
-            if self.whitePawns[endPos] or code in range(8,16):
-                self.halfMoveClock = self.prevHalfMoveClock.pop()
-                self.whitePawns[startPos] = True
-                
-                if code == 5:
-                    self.blackPawns[endPos-8] = True
-                    self.prevCapture.pop()
-
-                if code == 8 or code == 12:
-                    self.whiteKnights[endPos] = False
-                elif code == 9 or code == 13:
-                    self.whiteBishops[endPos] = False
-                elif code == 10 or code == 14:
-                    self.whiteRooks[endPos] = False
-                elif code == 11 or code == 15:
-                    self.whiteQueens[endPos] = False
-                else:
-                    self.whitePawns[endPos] = False
-
-            elif self.whiteKnights[endPos]:
-                self.whiteKnights[startPos] = True
-                self.whiteKnights[endPos] = False
-
-            elif self.whiteBishops[endPos]:
-                self.whiteBishops[startPos] = True
-                self.whiteBishops[endPos] = False
-
-            elif self.whiteRooks[endPos]:
-                self.whiteRooks[startPos] = True
-                self.whiteRooks[endPos] = False
-                if startPos == 0 or startPos == 7:
-                    self.castlingRights = self.prevCastlingRights.pop()
-
-            elif self.whiteQueens[endPos]:
-                self.whiteQueens[startPos] = True
-                self.whiteQueens[endPos] = False
-
-            elif self.whiteKing[endPos]:
-                self.castlingRights = self.prevCastlingRights.pop()
-                self.whiteKing[startPos] = True
-                self.whiteKing[endPos] = False
-                if code == 2:
-                    self.whiteRooks[7] = True
-                    self.whiteRooks[5] = False
-                elif code == 3:
-                    self.whiteRooks[0] = True
-                    self.whiteRooks[3] = False
-            
-            self.enPassant = self.prevEPs.pop()
-
-            if code in [4, 12, 13, 14, 15]:
-                self.halfMoveClock = self.prevHalfMoveClock.pop()
-                prevCapture = self.prevCapture.pop()
-                if prevCapture == piece.Piece.BISHOP:
-                    self.blackBishops[endPos] = True
-                elif prevCapture == piece.Piece.KING:
-                    self.blackKing[endPos] = True
-                elif prevCapture == piece.Piece.KNIGHT:
-                    self.blackKnights[endPos] = True
-                elif prevCapture == piece.Piece.PAWN:
-                    self.blackPawns[endPos] = True
-                elif prevCapture == piece.Piece.ROOK:
-                    self.blackRooks[endPos] = True
-                    if endPos == 56 or endPos == 63:
-                        self.castlingRights = self.prevCastlingRights.pop()
-                elif prevCapture == piece.Piece.QUEEN:
-                    self.blackQueens[endPos] = True
-
-        elif self.toPlay == colour.Colour.WHITE:
-            self.toPlay = colour.Colour.BLACK
-            self.fullMoves -= 1
-            if self.blackPawns[endPos] or code in range(8,16):
-                self.halfMoveClock = self.prevHalfMoveClock.pop()
-                self.blackPawns[startPos] = True
-                
-                if code == 5:
-                    self.whitePawns[endPos+8] = True
-                    self.prevCapture.pop()
-
-                if code == 8 or code == 12:
-                    self.blackKnights[endPos] = False
-                elif code == 9 or code == 13:
-                    self.blackBishops[endPos] = False
-                elif code == 10 or code == 14:
-                    self.blackRooks[endPos] = False
-                elif code == 11 or code == 15:
-                    self.blackQueens[endPos] = False
-                else:
-                    self.blackPawns[endPos] = False
-
-            elif self.blackKnights[endPos]:
-                self.blackKnights[startPos] = True
-                self.blackKnights[endPos] = False
-
-            elif self.blackBishops[endPos]:
-                self.blackBishops[startPos] = True
-                self.blackBishops[endPos] = False
-
-            elif self.blackRooks[endPos]:
-                self.blackRooks[startPos] = True
-                self.blackRooks[endPos] = False
-                if startPos == 56 or startPos == 63:
-                    self.castlingRights = self.prevCastlingRights.pop()
-
-            elif self.blackQueens[endPos]:
-                self.blackQueens[startPos] = True
-                self.blackQueens[endPos] = False
-
-            elif self.blackKing[endPos]:
-                self.castlingRights = self.prevCastlingRights.pop()
-                self.blackKing[startPos] = True
-                self.blackKing[endPos] = False
-                if code == 2:
-                    self.blackRooks[63] = True
-                    self.blackRooks[61] = False
-                elif code == 3:
-                    self.blackRooks[56] = True
-                    self.blackRooks[59] = False
-            
-            self.enPassant = self.prevEPs.pop()
-
-            if code in [4, 12, 13, 14, 15]:
-                self.halfMoveClock = self.prevHalfMoveClock.pop()
-                prevCapture = self.prevCapture.pop()
-                if prevCapture == piece.Piece.BISHOP:
-                    self.whiteBishops[endPos] = True
-                elif prevCapture == piece.Piece.KING:
-                    self.whiteKing[endPos] = True
-                elif prevCapture == piece.Piece.KNIGHT:
-                    self.whiteKnights[endPos] = True
-                elif prevCapture == piece.Piece.PAWN:
-                    self.whitePawns[endPos] = True
-                elif prevCapture == piece.Piece.ROOK:
-                    self.whiteRooks[endPos] = True
-                    if endPos == 0 or endPos == 7:
-                        self.castlingRights = self.prevCastlingRights.pop()
-                elif prevCapture == piece.Piece.QUEEN:
-                    self.whiteQueens[endPos] = True    
-
-        self.whitePieces = self.whitePawns | self.whiteKnights | self.whiteBishops | self.whiteRooks | self.whiteQueens | self.whiteKing
-        self.blackPieces = self.blackPawns | self.blackKnights | self.blackBishops | self.blackRooks | self.blackQueens | self.blackKing
-        self.pieces = self.blackPieces | self.whitePieces
-    
-    def generateTTKey(self):
-        result = self.whitePawns.to01()+self.whiteKnights.to01()+self.whiteBishops.to01()+self.whiteRooks.to01()+self.whiteQueens.to01()+self.whiteKing.to01()
-        result += self.blackPawns.to01()+self.blackKnights.to01()+self.blackBishops.to01()+self.blackRooks.to01()+self.blackQueens.to01()+self.blackKing.to01()
-
-        if self.toPlay == colour.Colour.WHITE:
-            result += '1'
+                self.pawnHash ^= PIECE_KEYS[moved][startPos] ^ PIECE_KEYS[moved][endPos]
+        elif captured:
+            self.halfMoveClock = 0
         else:
-            result += '0'
-        
-        for right in "KQkq":
-            if right in self.castlingRights:
-                result += '1'
+            self.halfMoveClock += 1
+
+        if code >= 8:
+            self.removePiece(moved, startPos)
+            if moved == 'P':
+                promoted = self.PROMOTIONS[code]
             else:
-                result += "0"
-                
-        if self.enPassant == "":
-            result += "00000000"
+                promoted = self.PROMOTIONS[code].lower()
+            self.putPiece(promoted, endPos)
+            hash ^= PIECE_KEYS[moved][startPos] ^ PIECE_KEYS[promoted][endPos]
         else:
-            for file in "abcdefgh":
-                if file == self.enPassant[0]:
-                    result += '1'
-                else:
-                    result += "0"
+            self.movePiece(moved, startPos, endPos)
+            keys = PIECE_KEYS[moved]
+            hash ^= keys[startPos] ^ keys[endPos]
+            if code == 2:
+                rook = self.mailbox[startPos+3]
+                self.movePiece(rook, startPos+3, startPos+1)
+                keys = PIECE_KEYS[rook]
+                hash ^= keys[startPos+3] ^ keys[startPos+1]
+            elif code == 3:
+                rook = self.mailbox[startPos-4]
+                self.movePiece(rook, startPos-4, startPos-1)
+                keys = PIECE_KEYS[rook]
+                hash ^= keys[startPos-4] ^ keys[startPos-1]
+
+        if self.enPassant != -1:
+            hash ^= EN_PASSANT_KEYS[self.enPassant & 7]
+        if code == 1:
+            self.enPassant = (startPos + endPos) // 2
+            hash ^= EN_PASSANT_KEYS[startPos & 7]
+        else:
+            self.enPassant = -1
+
+        castlingRights = self.castlingRights & self.CASTLING_MASKS[startPos] & self.CASTLING_MASKS[endPos]
+        if castlingRights != self.castlingRights:
+            hash ^= CASTLING_KEYS[self.castlingRights] ^ CASTLING_KEYS[castlingRights]
+            self.castlingRights = castlingRights
+        self.hash = hash
+
+    def unmake(self, move: int):
+        startPos, endPos, code = move & 63, move >> 6 & 63, move >> 12
+        self.ply -= 1
+        record = self.undoStack[self.ply]
+        self.castlingRights = record.castlingRights
+        self.enPassant = record.enPassant
+        self.halfMoveClock = record.halfMoveClock
+        self.hash = record.hash
+        self.pawnHash = record.pawnHash
+
+        if self.toPlay == colour.WHITE:
+            self.fullMoves -= 1
+        self.toPlay ^= 1
 
-        return bitarray(result).tobytes()
+        if code >= 8:
+            promoted = self.mailbox[endPos]
+            self.removePiece(promoted, endPos)
+            if promoted.isupper():
+                self.putPiece('P', startPos)
+            else:
+                self.putPiece('p', startPos)
+        else:
+            self.movePiece(self.mailbox[endPos], endPos, startPos)
+            if code == 2:
+                self.movePiece(self.mailbox[startPos+1], startPos+1, startPos+3)
+            elif code == 3:
+                self.movePiece(self.mailbox[startPos-1], startPos-1, startPos-4)
+
+        if code == 5:
+            self.putPiece(record.captured, (startPos & 56) | (endPos & 7))
+        elif record.captured:
+            self.putPiece(record.captured, endPos)
     
-    def age(self):
-        if self.toPlay == colour.Colour.WHITE:
-            return 2*self.fullMoves
-        return 2*self.fullMoves+1
+    # Zobrist key of the position computed from scratch, to check the one kept up to date by make/unmake
+    def computeHash(self) -> int:
+        hash = 0
+        for position, char in enumerate(self.mailbox):
+            if char:
+                hash ^= PIECE_KEYS[char][position]
+        if self.toPlay == colour.BLACK:
+            hash ^= SIDE_KEY
+        hash ^= CASTLING_KEYS[self.castlingRights]
+        if self.enPassant != -1:
+            hash ^= EN_PASSANT_KEYS[self.enPassant & 7]
+        return hash
+
+    # Key of the pawn structure computed from scratch
+    def computePawnHash(self) -> int:
+        hash = NO_PAWNS_KEY
+        for position, char in enumerate(self.mailbox):
+            if char == 'P' or char == 'p':
+                hash ^= PIECE_KEYS[char][position]
+        return hash
     
     def gameOver(self, moves=None):
+        if self.drawnByRule():
+            return True
         if moves == None:
-            moves = self.generateMoves()
+            return not self.hasLegalMove()
+        return len(moves) == 0
+
+    # Fifty-move rule or insufficient material
+    def drawnByRule(self):
         if self.halfMoveClock >= 100:
             return True
-        if len(moves) == 0:
-            return True
-        if self.whitePawns.any() or self.whiteRooks.any() or self.whiteQueens.any() or self.blackPawns.any() or self.blackRooks.any() or self.blackQueens.any():
+        counts = self.pieceCounts
+        if counts['P'] or counts['R'] or counts['Q'] or counts['p'] or counts['r'] or counts['q']:
             return False
-        if self.whiteBishops.count() >= 2 or (self.whiteBishops.count() == 1 and self.whiteKnights.count() == 1):
+        if counts['B'] >= 2 or (counts['B'] == 1 and counts['N'] == 1):
             return False
-        if self.blackBishops.count() >= 2 or (self.blackBishops.count() == 1 and self.blackKnights.count() == 1):
+        if counts['b'] >= 2 or (counts['b'] == 1 and counts['n'] == 1):
             return False
         return True
 
-    def getResult(self, moves=None):
-        if moves == None:
-            moves = self.generateMoves()
-        if len(moves) == 0 and self.inCheck()[0]:
-            if self.toPlay == colour.Colour.WHITE:
+    # Whether there is a legal move can be given as hasMove when the caller already knows it
+    def getResult(self, moves=None, hasMove=None):
+        if hasMove != None:
+            noMoves = not hasMove
+        elif moves == None:
+            noMoves = not self.hasLegalMove()
+        else:
+            noMoves = len(moves) == 0
+        if noMoves:
+            if not self.squareAttackedBy(self.kingSquare(self.toPlay), colour.opposite(self.toPlay)):
+                return 0
+            if self.toPlay == colour.WHITE:
                 return -1
             else:
                 return 1
-        elif self.gameOver(moves):
+        elif self.drawnByRule():
             return 0
         else:
             return None
         
+    # (pawns, knights, king, diagonal sliders, straight sliders) of colour col, each as an int with square i at
+    # bit i. The sliders are combined as ints, so no bitboard is built for them
+    def attackerSets(self, col) -> tuple[int, int, int, int, int]:
+        toBits = self.toBits
+        if col == colour.WHITE:
+            queens = toBits(self.whiteQueens)
+            return (toBits(self.whitePawns), toBits(self.whiteKnights), toBits(self.whiteKing),
+                    toBits(self.whiteBishops) | queens, toBits(self.whiteRooks) | queens)
+        queens = toBits(self.blackQueens)
+        return (toBits(self.blackPawns), toBits(self.blackKnights), toBits(self.blackKing),
+                toBits(self.blackBishops) | queens, toBits(self.blackRooks) | queens)
+
+    # Pieces of colour col attacking a square, as an int with square i at bit i
+    def attackersOf(self, position: int, col) -> int:
+        occupancy = self.toBits(self.pieces)
+        pawns, knights, king, diagonal, straight = self.attackerSets(col)
+        # A pawn of col attacks the square exactly when an opposing pawn there would attack the pawn
+        return ((PAWN_ATTACK_BITS[colour.opposite(col)][position] & pawns)
+                | (KNIGHT_ATTACK_BITS[position] & knights)
+                | (KING_ATTACK_BITS[position] & king)
+                | (bishopAttacks(position, occupancy) & diagonal)
+                | (rookAttacks(position, occupancy) & straight))
+
+    def squareAttackedBy(self, position: int, col) -> bool:
+        pawns, knights, king, diagonal, straight = self.attackerSets(col)
+        if PAWN_ATTACK_BITS[colour.opposite(col)][position] & pawns:
+            return True
+        if KNIGHT_ATTACK_BITS[position] & knights:
+            return True
+        if KING_ATTACK_BITS[position] & king:
+            return True
+        occupancy = self.toBits(self.pieces)
+        if bishopAttacks(position, occupancy) & diagonal:
+            return True
+        return rookAttacks(position, occupancy) & straight != 0
+
+    # Squares of the opposing pieces giving check to the side to move
+    def checkers(self) -> list[int]:
+        return list(bitSquares(self.attackersOf(self.kingSquare(self.toPlay), colour.opposite(self.toPlay))))
+
     def inCheck(self):
-        flag = False
-        checkingPiecePositions = []
-        self.toPlay = colour.Colour.opposite(self.toPlay)
-        moves = self.generatePseudoLegalMoves()
-        for move in moves: 
-            self.applyMove(move)
-            if not self.blackKing.any() or not self.whiteKing.any():
-                flag = True
-                checkingPiecePositions.append(move[0])
-            self.unmake(move)
-        self.toPlay = colour.Colour.opposite(self.toPlay)
-        return flag, checkingPiecePositions
+        checkingPiecePositions = self.checkers()
+        return len(checkingPiecePositions) > 0, checkingPiecePositions
 
     def copy(self):
-        return Board(orig=self)
+        return type(self)(orig=self)
     
-    def generateMoves(self) -> list[tuple[int, int, int]]:
-        moves = self.generatePseudoLegalMoves()
-        legalMoves = []
-        inCheck, positions = self.inCheck()
-        if inCheck:
-            if self.toPlay == colour.Colour.WHITE:
-                kingPos = self.whiteKing.index(1)
-            else:
-                kingPos = self.blackKing.index(1)
-            if len(positions) > 1:
-                for move in moves:
-                    if move[0] == kingPos and self.validMove(move):
-                        legalMoves.append(move)
-            else:
-                checkingPiecePosition = positions[0]
-                kingDiagonal = diagonalMask(kingPos)
-                kingAntiDiagonal = antiDiagonalMask(kingPos)
-                kingRank = rankMask(kingPos)
-                kingFile = fileMask(kingPos)
-                checkLine = None
-                if kingDiagonal[checkingPiecePosition]:
-                    checkLine = kingDiagonal
-                elif kingAntiDiagonal[checkingPiecePosition]:
-                    checkLine = kingAntiDiagonal
-                elif kingRank[checkingPiecePosition]:
-                    checkLine = kingRank
-                elif kingFile[checkingPiecePosition]:
-                    checkLine = kingFile
-                if checkLine != None:
-                    for move in moves:
-                        if move[2] not in [2,3] and ((move[0] == kingPos and not checkLine[move[1]]) or checkLine[move[1]]) and self.validMove(move):
-                            legalMoves.append(move)
-                else:
-                    for move in moves:
-                        if ((move[0] == kingPos and move[2] not in [2,3]) or move[1] == checkingPiecePosition) and self.validMove(move):
-                            legalMoves.append(move)
+    # Squares attacked by colour col for a given occupancy, as an int with square i at bit i
+    def attackedSquares(self, col, occupancy: int) -> int:
+        pawns, knights, king, diagonal, straight = self.attackerSets(col)
+        pawnAttacks = PAWN_ATTACK_BITS[col]
+        attacked = KING_ATTACK_BITS[king.bit_length() - 1]
+        for position in bitSquares(pawns):
+            attacked |= pawnAttacks[position]
+        for position in bitSquares(knights):
+            attacked |= KNIGHT_ATTACK_BITS[position]
+        for position in bitSquares(diagonal):
+            attacked |= bishopAttacks(position, occupancy)
+        for position in bitSquares(straight):
+            attacked |= rookAttacks(position, occupancy)
+        return attacked
+
+    # Squares the pieces pinned to the king of colour col may move to, keyed by the pinned piece's square
+    def pinRays(self, col) -> dict[int, int]:
+        kingPos = self.kingSquare(col)
+        if col == colour.WHITE:
+            ownBits, enemyBits = self.toBits(self.whitePieces), self.toBits(self.blackPieces)
         else:
-            if self.toPlay == colour.Colour.WHITE:
-                kingPos = self.whiteKing.index(1)
-                kingDiagonal = diagonalMask(kingPos)
-                kingAntiDiagonal = antiDiagonalMask(kingPos)
-                kingRank = rankMask(kingPos)
-                kingFile = fileMask(kingPos)
-                for move in moves:
-                    if move[2] == 5 or move[0] == kingPos:
-                        if self.validMove(move):
-                            if move[2] == 2:
-                                if self.validMove((4, 5, 0)):
-                                    legalMoves.append(move)
-                            elif move[2] == 3:
-                                if self.validMove((4, 3, 0)):
-                                    legalMoves.append(move)
-                            else:
-                                legalMoves.append(move)
-                    elif not ((kingDiagonal[move[0]] and (kingDiagonal & (self.blackBishops | self.blackQueens)).any() and not kingDiagonal[move[1]]) 
-                              or (kingAntiDiagonal[move[0]] and (kingAntiDiagonal & (self.blackBishops | self.blackQueens)).any() and not kingAntiDiagonal[move[1]]) 
-                              or (kingRank[move[0]] and (kingRank & (self.blackRooks | self.blackQueens)).any() and not kingRank[move[1]])
-                              or (kingFile[move[0]] and (kingFile & (self.blackRooks | self.blackQueens)).any() and not kingFile[move[1]])):
-                        legalMoves.append(move)
-                    elif self.validMove(move):
-                        legalMoves.append(move)
-            else:
-                kingPos = self.blackKing.index(1)
-                kingDiagonal = diagonalMask(kingPos) | self.blackKing
-                kingAntiDiagonal = antiDiagonalMask(kingPos) | self.blackKing
-                kingRank = rankMask(kingPos) | self.blackKing
-                kingFile = fileMask(kingPos) | self.blackKing
-                for move in moves:
-                    if move[2] == 5 or move[0] == kingPos:
-                        if self.validMove(move):
-                            if move[2] == 2:
-                                if self.validMove((60, 61, 0)):
-                                    legalMoves.append(move)
-                            elif move[2] == 3:
-                                if self.validMove((60, 59, 0)):
-                                    legalMoves.append(move)
-                            else:
-                                legalMoves.append(move)
-                    elif not ((kingDiagonal[move[0]] and (kingDiagonal & (self.whiteBishops | self.whiteQueens)).any() and not kingDiagonal[move[1]]) 
-                              or (kingAntiDiagonal[move[0]] and (kingAntiDiagonal & (self.whiteBishops | self.whiteQueens)).any() and not kingAntiDiagonal[move[1]]) 
-                              or (kingRank[move[0]] and (kingRank & (self.whiteRooks | self.whiteQueens)).any() and not kingRank[move[1]])
-                              or (kingFile[move[0]] and (kingFile & (self.whiteRooks | self.whiteQueens)).any() and not kingFile[move[1]])):
-                        legalMoves.append(move)
-                    elif self.validMove(move):
-                        legalMoves.append(move)
-        return legalMoves
+            ownBits, enemyBits = self.toBits(self.blackPieces), self.toBits(self.whitePieces)
+        _, _, _, diagonal, straight = self.attackerSets(colour.opposite(col))
+        # Enemy sliders that would attack the king if our own pieces were not in the way
+        snipers = (bishopAttacks(kingPos, enemyBits) & diagonal) | (rookAttacks(kingPos, enemyBits) & straight)
+        pins = {}
+        for sniper in bitSquares(snipers):
+            between = BETWEEN_BITS[kingPos][sniper]
+            blockers = between & (ownBits | enemyBits)
+            if blockers & ownBits and blockers.bit_count() == 1:
+                pins[blockers.bit_length() - 1] = between | 1 << sniper
+        return pins
+
+    def generateMoves(self, loud=True, quiet=True) -> array:
+        return array('H', self.legalMoves(self.generatePseudoLegalMoves(loud, quiet)))
+
+    # Legal captures and promotions only, for quiescence search
+    def generateLoudMoves(self) -> array:
+        return self.generateMoves(quiet=False)
+
+    # Everything needed to decide which pseudo-legal moves of the side to move are legal
+    def legalityMasks(self):
+        us = self.toPlay
+        them = colour.opposite(us)
+        kingPos = self.kingSquare(us)
+        occupancy = self.toBits(self.pieces)
+        checkers = self.attackersOf(kingPos, them)
+        # Squares the king may not step to: attacked ones, including those behind it on a checking slider's line
+        kingDanger = self.attackedSquares(them, occupancy & ~(1 << kingPos))
+        if checkers.bit_count() > 1:
+            # Double check: only the king may move
+            return kingPos, occupancy, checkers, kingDanger, 0, {}
+        if checkers:
+            # Single check: capture the checker or block the line between it and the king
+            checker = checkers.bit_length() - 1
+            evasionMask = checkers | BETWEEN_BITS[kingPos][checker]
+        else:
+            evasionMask = -1
+        return kingPos, occupancy, checkers, kingDanger, evasionMask, self.pinRays(us)
+
+    # The legal moves among pseudo-legal moves of the side to move, yielded one at a time
+    def legalMoves(self, moves, masks=None):
+        if masks is None:
+            masks = self.legalityMasks()
+        (kingPos, occupancy, checkers, kingDanger, evasionMask, pins) = masks
+        for move in moves:
+            startPos, endPos, code = move & 63, move >> 6 & 63, move >> 12
+            if startPos == kingPos:
+                if code == 2 or code == 3:
+                    # The king may not castle out of, through or into check
+                    if not checkers and not kingDanger >> ((startPos + endPos) // 2) & 1 and not kingDanger >> endPos & 1:
+                        yield move
+                elif not kingDanger >> endPos & 1:
+                    yield move
+            elif code == 5:
+                if self.legalEnPassant(move, kingPos, occupancy):
+                    yield move
+            elif evasionMask >> endPos & 1 and (startPos not in pins or pins[startPos] >> endPos & 1):
+                yield move
+
+    # Whether a quiet move (codes 0 to 3) taken from elsewhere, such as a hash move, is pseudo-legal here, checked
+    # without generating any moves
+    def pseudoLegalQuiet(self, move: int) -> bool:
+        startPos, endPos, code = move & 63, move >> 6 & 63, move >> 12
+        char = self.mailbox[startPos]
+        if not char or char.isupper() != (self.toPlay == colour.WHITE) or self.mailbox[endPos]:
+            return False
+        kind = char.upper()
+        if kind == 'P':
+            forward = 8 if self.toPlay == colour.WHITE else -8
+            if code == 1:
+                homeRank = 1 if self.toPlay == colour.WHITE else 6
+                return startPos >> 3 == homeRank and endPos == startPos + 2*forward and not self.mailbox[startPos + forward]
+            # A push to the last rank is a promotion
+            return code == 0 and endPos == startPos + forward and 0 < endPos >> 3 < 7
+        if code == 2 or code == 3:
+            return move in self.generatePseudoLegalKingMoves(0)
+        if code != 0:
+            return False
+        occupancy = self.toBits(self.pieces)
+        if kind == 'N':
+            attacks = KNIGHT_ATTACK_BITS[startPos]
+        elif kind == 'K':
+            attacks = KING_ATTACK_BITS[startPos]
+        elif kind == 'B':
+            attacks = bishopAttacks(startPos, occupancy)
+        elif kind == 'R':
+            attacks = rookAttacks(startPos, occupancy)
+        else:
+            attacks = queenAttacks(startPos, occupancy)
+        return attacks >> endPos & 1 == 1
+
+    # Legal moves of the side to move, generated one piece kind at a time so that callers can stop early. King
+    # moves come first: they are the only candidates in double check
+    def _legalMovesByPiece(self, masks):
+        generators = (self.generatePseudoLegalKingMoves, self.generatePseudoLegalPawnMoves, self.generatePseudoLegalKnightMoves,
+                      self.generatePseudoLegalRookMoves, self.generatePseudoLegalBishopMoves, self.generatePseudoLegalQueenMoves)
+        for generate in generators:
+            yield from self.legalMoves(generate(), masks)
+
+    # Whether the side to move has any legal move, stopping at the first one found
+    def hasLegalMove(self, masks=None) -> bool:
+        if masks is None:
+            masks = self.legalityMasks()
+        return any(True for _ in self._legalMovesByPiece(masks))
+
+    # Number of legal moves of the side to move, counted piece by piece without building or sorting the move list
+    def countLegalMoves(self) -> int:
+        return sum(1 for _ in self._legalMovesByPiece(self.legalityMasks()))
+
+    # En passant removes two pawns from a line at once, so it is checked against the resulting occupancy
+    def legalEnPassant(self, move: int, kingPos: int, occupancy: int) -> bool:
+        startPos, endPos = move & 63, move >> 6 & 63
+        capturedBit = 1 << (endPos - 8 if self.toPlay == colour.WHITE else endPos + 8)
+        pawns, knights, _, diagonal, straight = self.attackerSets(colour.opposite(self.toPlay))
+        occupancy = (occupancy & ~(1 << startPos) & ~capturedBit) | 1 << endPos
+        if PAWN_ATTACK_BITS[self.toPlay][kingPos] & pawns & ~capturedBit or KNIGHT_ATTACK_BITS[kingPos] & knights:
+            return False
+        return not (bishopAttacks(kingPos, occupancy) & diagonal or rookAttacks(kingPos, occupancy) & straight)
     
-    def filterQuiescenceMoves(self, moves=None) -> list[tuple[int, int, int]]:
+    def filterQuiescenceMoves(self, moves=None) -> array:
         if moves == None:
-            moves = self.generateMoves()
-        loudMoves = []
+            moves = self.generateLoudMoves()
+        loudMoves = array('H')
+        mailbox = self.mailbox
         for move in moves:
-            if move[2] >= 8 or move[2] == 4 and not (self.whitePawns[move[1]] or self.blackPawns[move[1]]):
+            code = move >> 12
+            if code >= 8 or code == 4 and mailbox[move >> 6 & 63] not in 'Pp':
                 loudMoves.append(move)
         return loudMoves
+
+    # The loud moves quiescence searches, and whether the side to move has any legal move at all. Any legal loud
+    # move settles the latter; otherwise it is looked for with the masks already built for the loud moves
+    def quiescenceMoves(self):
+        masks = self.legalityMasks()
+        loudMoves = array('H', self.legalMoves(self.generatePseudoLegalMoves(quiet=False), masks))
+        return self.filterQuiescenceMoves(loudMoves), len(loudMoves) > 0 or self.hasLegalMove(masks)
     
     def validMove(self, move):
-        flag = True
         self.applyMove(move)
-        nextMoves = self.generatePseudoLegalMoves()
-        if self.toPlay == colour.Colour.WHITE:
-            kingPos = self.blackKing.index(1)
-        else:
-            kingPos = self.whiteKing.index(1)
-        for nextMove in nextMoves:
-            if (nextMove[1] == kingPos):
-                flag = False
+        flag = not self.squareAttackedBy(self.kingSquare(colour.opposite(self.toPlay)), self.toPlay)
         self.unmake(move)
         return flag
             
-    def perft(self, depth):
-        moves = self.generateMoves()
-        if depth == 1:
-            return len(moves)
+    # Leaf nodes at the given depth; with bulk counting the last ply is counted rather than played
+    def perft(self, depth, bulk=True):
+        if depth == 0:
+            return 1
+        if bulk and depth == 1:
+            return self.countLegalMoves()
         
         nodes = 0
         
-        for move in moves:
+        for move in self.generateMoves():
             self.applyMove(move)
-            nodes += self.perft(depth-1)
+            nodes += self.perft(depth-1, bulk)
             self.unmake(move)
         
         return nodes
 
+    # Perft with subtree counts cached by position and depth, so transposed subtrees are only searched once
+    def hashPerft(self, depth, cache=None, bulk=True):
+        if depth <= 1:
+            return self.perft(depth, bulk)
+        if cache == None:
+            cache = {}
+        key = (self.hash, depth)
+        if key in cache:
+            return cache[key]
+
+        nodes = 0
+
+        for move in self.generateMoves():
+            self.applyMove(move)
+            nodes += self.hashPerft(depth-1, cache, bulk)
+            self.unmake(move)
+
+        cache[key] = nodes
+        return nodes
+
+    # Perft split by root move, keyed by the move in long algebraic notation
+    def divide(self, depth, bulk=True) -> dict:
+        counts = {}
+        for move in self.generateMoves():
+            self.applyMove(move)
+            counts[moveToAlgebraic(move)] = self.perft(depth-1, bulk)
+            self.unmake(move)
+        return counts
+
     def findMove(self, algebraic_move):
         legal_moves = self.generatePseudoLegalMoves()
         move_start = posToIndex(algebraic_move[0:2])
@@ -1240,10 +839,12 @@ class Board:
             elif (promotion_type_string == "q"):
                 promotion_type = 3
             for move in legal_moves:
-                if (move[0] == move_start and move[1] == move_end and move[2] % 4 == promotion_type):
+                (start, end, code) = decodeMove(move)
+                if (start == move_start and end == move_end and code % 4 == promotion_type):
                     return move
         else:
             for move in legal_moves:
-                if (move[0] == move_start and move[1] == move_end):
+                (start, end, code) = decodeMove(move)
+                if (start == move_start and end == move_end):
                     return move
         return None
\ No newline at end of file
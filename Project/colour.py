@@ -1,17 +1,12 @@
-from enum import Enum
+# Sides are plain ints so they can index per-colour tables and be flipped with ^ 1
+WHITE = 0
+BLACK = 1
 
-class Colour(Enum):
-    WHITE = 1
-    BLACK = 2
-    
-    def opposite(col):
-        if col == Colour.BLACK:
-            return Colour.WHITE
-        else:
-            return Colour.BLACK
-        
-    def fromString(string: str):
-        if string.lower() in ["w", "white"]:
-            return Colour.WHITE
-        if string.lower() in ["b", "black"]:
-            return Colour.BLACK
\ No newline at end of file
+def opposite(col: int) -> int:
+    return col ^ 1
+
+def fromString(string: str):
+    if string.lower() in ["w", "white"]:
+        return WHITE
+    if string.lower() in ["b", "black"]:
+        return BLACK
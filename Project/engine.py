@@ -1,11 +1,21 @@
 import colour
 import board
-import ttentry
-from bitarray import bitarray
+import intboard
+import transpositiontable
+import analysiscache
+import pawntable
+import os
 import time
 import sys
 from bitarray_masks import *
 
+# Board implementations the engine can search with, selected by name when the engine is constructed
+BOARD_BACKENDS = {"bitarray": board.Board, "int": intboard.IntBoard}
+# Name of the shared memory transposition table the xboard engine and the tutor search with
+SHARED_TT_NAME = "explainable_chess_tt"
+# File the xboard engine and the tutor keep the results of their searches in between sessions
+ANALYSIS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "analysis.cache")
+
 class Engine:
     MG_PAWN_POS_TABLE = [0,   0,   0,   0,   0,   0,  0,   0,
                       -35,  -1, -20, -23, -15,  24, 38, -22,
@@ -126,179 +136,273 @@ class Engine:
                             -12,  17,  14,  17,  17,  38,  23,  11,        
                             -74, -35, -18, -18, -11,  15,   4, -17
                       ]
+
+    MG_POS_TABLES = {'P': MG_PAWN_POS_TABLE, 'N': MG_KNIGHT_POS_TABLE, 'B': MG_BISHOP_POS_TABLE, 'R': MG_ROOK_POS_TABLE, 'Q': MG_QUEEN_POS_TABLE, 'K': MG_KING_POS_TABLE}
+    EG_POS_TABLES = {'P': EG_PAWN_POS_TABLE, 'N': EG_KNIGHT_POS_TABLE, 'B': EG_BISHOP_POS_TABLE, 'R': EG_ROOK_POS_TABLE, 'Q': EG_QUEEN_POS_TABLE, 'K': EG_KING_POS_TABLE}
     
-    def __init__(self, FEN=None):
-        self.board = board.Board(FEN)
+    def __init__(self, FEN=None, backend="bitarray", ttSizeMB=16, ttName=None, analysisCache=None):
+        self.board = BOARD_BACKENDS[backend](FEN)
 
-        self.playing = colour.Colour.BLACK
+        self.playing = colour.BLACK
 
         self.remaining_time = 30000
         self.opp_remaining_time = 30000
 
-        # Transposition table with positions and their evaluations
-        self.transpositionTable = {}
+        # Transposition table with positions and their evaluations, of bounded size. With a name, the table is
+        # shared with every other engine that opens it, in this process or another
+        if ttName == None:
+            self.transpositionTable = transpositiontable.TranspositionTable(ttSizeMB)
+        else:
+            self.transpositionTable = transpositiontable.sharedTable(ttName, ttSizeMB)
+
+        # Pawn structure terms of the pawn structures evaluated so far, keyed by the board's pawn key
+        self.pawnTable = pawntable.PawnTable()
+
+        # Optional analysis cache of finished searches, looked up before searching from the root
+        self.analysisCache = analysisCache
+
+        # Killer moves, keyed by the board's ply
+        self.killers = {}
+
+        # Ply of the board the current search started from, that mate scores count the distance from
+        self.rootPly = self.board.ply
 
     def evalMaterial(self, phase) -> int:
-        mgMaterial = self.board.whitePawns.count()*82 + self.board.whiteKnights.count()*337 + self.board.whiteBishops.count()*365 + self.board.whiteRooks.count()*477 + self.board.whiteQueens.count()*1025
-        mgMaterial -= self.board.blackPawns.count()*82 + self.board.blackKnights.count()*337 + self.board.blackBishops.count()*365 + self.board.blackRooks.count()*477 + self.board.blackQueens.count()*1025
-        egMaterial = self.board.whitePawns.count()*94 + self.board.whiteKnights.count()*281 + self.board.whiteBishops.count()*297 + self.board.whiteRooks.count()*512 + self.board.whiteQueens.count()*936
-        egMaterial -= self.board.blackPawns.count()*94 + self.board.blackKnights.count()*281 + self.board.blackBishops.count()*297 + self.board.blackRooks.count()*512 + self.board.blackQueens.count()*936
+        counts = self.board.pieceCounts
+        mgMaterial = counts['P']*82 + counts['N']*337 + counts['B']*365 + counts['R']*477 + counts['Q']*1025
+        mgMaterial -= counts['p']*82 + counts['n']*337 + counts['b']*365 + counts['r']*477 + counts['q']*1025
+        egMaterial = counts['P']*94 + counts['N']*281 + counts['B']*297 + counts['R']*512 + counts['Q']*936
+        egMaterial -= counts['p']*94 + counts['n']*281 + counts['b']*297 + counts['r']*512 + counts['q']*936
 
         return (mgMaterial*(24-phase)+egMaterial*phase)/24
     
     def evalPositioning(self, phase):
         mg_value = 0
-        for i in range(64):
-            if self.board.whitePawns[i]:
-                mg_value += self.MG_PAWN_POS_TABLE[i]
-            elif self.board.blackPawns[i]:
-                mg_value -= self.MG_PAWN_POS_TABLE[i^56]
-            elif self.board.whiteKnights[i]:
-                mg_value += self.MG_KNIGHT_POS_TABLE[i]
-            elif self.board.blackKnights[i]:
-                mg_value -= self.MG_KNIGHT_POS_TABLE[i^56]
-            elif self.board.whiteBishops[i]:
-                mg_value += self.MG_BISHOP_POS_TABLE[i]
-            elif self.board.blackBishops[i]:
-                mg_value -= self.MG_BISHOP_POS_TABLE[i^56]
-            elif self.board.whiteRooks[i]:
-                mg_value += self.MG_ROOK_POS_TABLE[i]
-            elif self.board.blackRooks[i]:
-                mg_value -= self.MG_ROOK_POS_TABLE[i^56]
-            elif self.board.whiteQueens[i]:
-                mg_value += self.MG_QUEEN_POS_TABLE[i]
-            elif self.board.blackQueens[i]:
-                mg_value -= self.MG_QUEEN_POS_TABLE[i^56]
-            elif self.board.whiteKing[i]:
-                mg_value += self.MG_KING_POS_TABLE[i]
-            elif self.board.blackKing[i]:
-                mg_value -= self.MG_KING_POS_TABLE[i^56]
         eg_value = 0
-        for i in range(64):
-            if self.board.whitePawns[i]:
-                eg_value += self.EG_PAWN_POS_TABLE[i]
-            elif self.board.blackPawns[i]:
-                eg_value -= self.EG_PAWN_POS_TABLE[i^56]
-            elif self.board.whiteKnights[i]:
-                eg_value += self.EG_KNIGHT_POS_TABLE[i]
-            elif self.board.blackKnights[i]:
-                eg_value -= self.EG_KNIGHT_POS_TABLE[i^56]
-            elif self.board.whiteBishops[i]:
-                eg_value += self.EG_BISHOP_POS_TABLE[i]
-            elif self.board.blackBishops[i]:
-                eg_value -= self.EG_BISHOP_POS_TABLE[i^56]
-            elif self.board.whiteRooks[i]:
-                eg_value += self.EG_ROOK_POS_TABLE[i]
-            elif self.board.blackRooks[i]:
-                eg_value -= self.EG_ROOK_POS_TABLE[i^56]
-            elif self.board.whiteQueens[i]:
-                eg_value += self.EG_QUEEN_POS_TABLE[i]
-            elif self.board.blackQueens[i]:
-                eg_value -= self.EG_QUEEN_POS_TABLE[i^56]
-            elif self.board.whiteKing[i]:
-                eg_value += self.EG_KING_POS_TABLE[i]
-            elif self.board.blackKing[i]:
-                eg_value -= self.EG_KING_POS_TABLE[i^56]
+        mailbox = self.board.mailbox
+        for i in self.board.setSquares(self.board.pieces):
+            char = mailbox[i]
+            if char.isupper():
+                mg_value += self.MG_POS_TABLES[char][i]
+                eg_value += self.EG_POS_TABLES[char][i]
+            else:
+                mg_value -= self.MG_POS_TABLES[char.upper()][i^56]
+                eg_value -= self.EG_POS_TABLES[char.upper()][i^56]
         return (mg_value*(24-phase)+eg_value*phase)/24
             
-    def evalDoubledPawns(self, penalty=20):
-        value = 0
+    # Pawn structure terms of a set of pawns of one colour: weak pawns, counting each file's pawns beyond the
+    # first (an empty file counting -1) and every pawn on a file without pawns on either side, and connections,
+    # counting each pair of pawns on neighbouring squares twice
+    def pawnStructure(self, pawns):
+        board = self.board
+        files = [board.popCount(board.fileBits(i) & pawns) for i in range(8)]
+        weak = 0
         for i in range(8):
-            file = bitarray('1000000010000000100000001000000010000000100000001000000010000000') >> i
-            value -= penalty * ((file & self.board.whitePawns).count()- 1)
-            value += penalty * ((file & self.board.blackPawns).count()- 1)
-        return value
-    
-    def evalIsolatedPawns(self, penalty=20):
-        value = 0
-        file = bitarray('1000000010000000100000001000000010000000100000001000000010000000')
-        value -= penalty * (file & self.board.whitePawns).count() * (1-int(((file >> 1) & self.board.whitePawns).any()))
-        value += penalty * (file & self.board.blackPawns).count() * (1-int(((file >> 1) & self.board.blackPawns).any()))
-        for i in range(1,7):
-            value -= penalty * ((file>>i) & self.board.whitePawns).count() * (1-int(((file >> (1+i)) & self.board.whitePawns).any())) * (1-int(((file >> (i-1)) & self.board.whitePawns).any()))
-            value += penalty * ((file>>i) & self.board.blackPawns).count() * (1-int(((file >> (1+i)) & self.board.blackPawns).any())) * (1-int(((file >> (i-1)) & self.board.blackPawns).any()))
-        value -= penalty * ((file>>7) & self.board.whitePawns).count() * (1-int(((file >> (6)) & self.board.whitePawns).any()))
-        value += penalty * ((file>>7) & self.board.blackPawns).count() * (1-int(((file >> (6)) & self.board.blackPawns).any()))
-        return value
-    
-    def evalConnectedPawns(self, reward=10):
-        value = 0
-        for i in range(64):
-            if self.board.whitePawns[i]:
-                value += reward * (kingAttackMask(i) & self.board.whitePawns).count()/2
-            elif self.board.blackPawns[i]:
-                value -= reward * (kingAttackMask(i) & self.board.blackPawns).count()/2
-        return value
-    
+            weak += files[i] - 1
+            if not (i > 0 and files[i-1]) and not (i < 7 and files[i+1]):
+                weak += files[i]
+        connections = 0
+        for i in board.setSquares(pawns):
+            connections += board.popCount(board.kingAttackBits(i) & pawns)
+        return weak, connections
+
+    # Doubled and isolated pawns are penalised by 12+phase/2 each and connected pawns rewarded by 6+phase/4 per
+    # pair, with the terms of each pawn structure only computed the first time it is seen
+    def evalPawnStructure(self, phase):
+        terms = self.pawnTable.probe(self.board.pawnHash)
+        if terms == None:
+            terms = self.pawnStructure(self.board.whitePawns) + self.pawnStructure(self.board.blackPawns)
+            self.pawnTable.store(self.board.pawnHash, *terms)
+        whiteWeak, whiteConnections, blackWeak, blackConnections = terms
+        return (12+phase/2) * (blackWeak - whiteWeak) + (6+phase/4) * (whiteConnections - blackConnections)/2
+
     def evalMobility(self, phase, weight=2):
-        value = len(self.board.generatePseudoLegalBishopMoves()+self.board.generatePseudoLegalKnightMoves()+self.board.generatePseudoLegalRookMoves()+self.board.generatePseudoLegalQueenMoves())
-        self.board.toPlay = colour.Colour.opposite(self.board.toPlay)
-        value -= len(self.board.generatePseudoLegalBishopMoves()+self.board.generatePseudoLegalKnightMoves()+self.board.generatePseudoLegalRookMoves()+self.board.generatePseudoLegalQueenMoves())
-        self.board.toPlay = colour.Colour.opposite(self.board.toPlay)
+        value = self.board.mobility(self.board.toPlay) - self.board.mobility(colour.opposite(self.board.toPlay))
 
         value *= weight*(24-phase)/24
-        if self.board.toPlay == colour.Colour.WHITE:
+        if self.board.toPlay == colour.WHITE:
             return value
         else:
             return -value
 
     def calcPhase(self):
+        counts = self.board.pieceCounts
         phase = 24
-        phase -= self.board.whiteKnights.count()
-        phase -= self.board.whiteBishops.count()
-        phase -= 2*self.board.whiteRooks.count()
-        phase -= 4*self.board.whiteQueens.count()
-        phase -= self.board.blackBishops.count()
-        phase -= self.board.blackKnights.count()
-        phase -= 2*self.board.blackRooks.count()
-        phase -= 4*self.board.blackQueens.count()
+        phase -= counts['N']
+        phase -= counts['B']
+        phase -= 2*counts['R']
+        phase -= 4*counts['Q']
+        phase -= counts['b']
+        phase -= counts['n']
+        phase -= 2*counts['r']
+        phase -= 4*counts['q']
         return phase
 
 
-    def heuristicEval(self, moves=None):
-        if self.board.gameOver(moves):
-            return self.board.getResult(moves)*10000
+    # Checkmate is worth MATE_VALUE less the number of plies from the root to it, so that nearer mates score higher
+    MATE_VALUE = 10000
+    MAX_MATE_PLY = 256
+
+    def heuristicEval(self, moves=None, hasMove=None):
+        result = self.board.getResult(moves, hasMove)
+        if result != None:
+            return result*(self.MATE_VALUE - (self.board.ply - self.rootPly))
         phase = self.calcPhase()
         mat_eval = self.evalMaterial(phase)
         pos_eval = self.evalPositioning(phase)
-        pawn_eval = self.evalDoubledPawns(12+phase/2) + self.evalIsolatedPawns(12+phase/2) + self.evalConnectedPawns(6+phase/4)
+        pawn_eval = self.evalPawnStructure(phase)
         mob_eval = self.evalMobility(phase)
         return int(mat_eval + pos_eval + pawn_eval + mob_eval)
     
-    def heuristicEvalReason(self, moves=None):
-        if self.board.gameOver(moves):
-            return self.board.getResult(moves)*10000, [self.board.getResult(moves), 0, 0, 0, 0]
+    def heuristicEvalReason(self, moves=None, hasMove=None):
+        result = self.board.getResult(moves, hasMove)
+        if result != None:
+            return result*(self.MATE_VALUE - (self.board.ply - self.rootPly)), [result, 0, 0, 0, 0]
         phase = self.calcPhase()
         mat_eval = int(self.evalMaterial(phase))
         pos_eval = int(self.evalPositioning(phase))
-        pawn_eval = int(self.evalDoubledPawns(12+phase/2) + self.evalIsolatedPawns(12+phase/2) + self.evalConnectedPawns(6+phase/4))
+        pawn_eval = int(self.evalPawnStructure(phase))
         mob_eval = int(self.evalMobility(phase))
         return mat_eval + pos_eval + pawn_eval + mob_eval, ["N/A", mat_eval, pos_eval, pawn_eval, mob_eval]
 
     def orderMoves(self, moves):
         reversed = False
-        if self.board.toPlay == colour.Colour.WHITE:
+        if self.board.toPlay == colour.WHITE:
             reversed = True
         evaluatedPositions = []
         boundedPositions = []
         unknownPositions = []
         for move in moves:
             self.board.applyMove(move)
-            key = self.board.generateTTKey()
+            key = self.board.hash
             self.board.unmake(move)
-            if key in self.transpositionTable:
-                transpositionEntry = self.transpositionTable[key]
-                if transpositionEntry.type == 1:
-                    evaluatedPositions.append((move, transpositionEntry.value))
+            transpositionEntry = self.transpositionTable.probe(key)
+            if transpositionEntry != None:
+                _, value, entryType, _ = transpositionEntry
+                if entryType == 1:
+                    evaluatedPositions.append((move, value))
                 else:
-                    boundedPositions.append((move, transpositionEntry.value))
+                    boundedPositions.append((move, value))
             else:
                 unknownPositions.append(move)
         evaluatedPositions.sort(key=lambda move: move[1], reverse=reversed)
         boundedPositions.sort(key=lambda move: move[1], reverse=reversed)
         return [item[0] for item in evaluatedPositions]+[item[0] for item in boundedPositions]+unknownPositions
 
+    # Piece values used only to order captures
+    ORDER_VALUES = {'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 100,
+                    'p': 1, 'n': 3, 'b': 3, 'r': 5, 'q': 9, 'k': 100}
+
+    # Split loud moves into captures that should not lose material (most valuable victim, then least valuable
+    # attacker first), promotions (queens first) and captures of a defended piece worth less than the attacker
+    def orderLoudMoves(self, moves):
+        mailbox = self.board.mailbox
+        them = colour.opposite(self.board.toPlay)
+        goodCaptures = []
+        promotions = []
+        badCaptures = []
+        for move in moves:
+            code = move >> 12
+            if code >= 8:
+                promotions.append(move)
+                continue
+            endPos = move >> 6 & 63
+            attacker = self.ORDER_VALUES[mailbox[move & 63]]
+            if code == 5:
+                victim = 1
+            else:
+                victim = self.ORDER_VALUES[mailbox[endPos]]
+            if victim >= attacker or not self.board.squareAttackedBy(endPos, them):
+                goodCaptures.append((16*victim - attacker, move))
+            else:
+                badCaptures.append((16*victim - attacker, move))
+        goodCaptures.sort(reverse=True)
+        badCaptures.sort(reverse=True)
+        promotions.sort(key=lambda move: move >> 12 & 3, reverse=True)
+        return [move for _, move in goodCaptures], promotions, [move for _, move in badCaptures]
+
+    # Legal moves in the order the search should try them: the hash move, good captures, promotions, killers,
+    # quiet moves and bad captures. Quiet moves are only generated once the earlier stages are used up.
+    def pickMoves(self, hashMove=None, killers=()):
+        board = self.board
+        # Legality masks are the same for every stage, so they are only built once
+        masks = board.legalityMasks()
+        loudMoves = list(board.legalMoves(board.generatePseudoLegalMoves(quiet=False), masks))
+        if hashMove is not None:
+            if hashMove >> 12 < 4:
+                # Only the hash move itself is checked, so that no quiet moves are generated if it cuts off
+                if board.pseudoLegalQuiet(hashMove) and any(board.legalMoves((hashMove,), masks)):
+                    yield hashMove
+            elif hashMove in loudMoves:
+                yield hashMove
+
+        goodCaptures, promotions, badCaptures = self.orderLoudMoves(loudMoves)
+        for move in goodCaptures:
+            if move != hashMove:
+                yield move
+        for move in promotions:
+            if move != hashMove:
+                yield move
+
+        quietMoves = list(board.legalMoves(board.generatePseudoLegalMoves(loud=False), masks))
+        for move in killers:
+            if move != hashMove and move in quietMoves:
+                yield move
+        for move in quietMoves:
+            if move != hashMove and move not in killers:
+                yield move
+
+        for move in badCaptures:
+            if move != hashMove:
+                yield move
+
+    # Entry type of a search result: an upper bound (3) if it is no better for white than alpha, a lower bound (2)
+    # if it is no better for black than beta, otherwise exact (1)
+    @staticmethod
+    def boundType(value, alpha, beta) -> int:
+        if value <= alpha:
+            return 3
+        if value >= beta:
+            return 2
+        return 1
+
+    # Mate scores are stored relative to the node, as the distance to mate from it, and converted back on probing
+    def storeTT(self, key, depth, value, type, move=0, explanation=None):
+        if value >= self.MATE_VALUE - self.MAX_MATE_PLY:
+            value += self.board.ply - self.rootPly
+        elif value <= -self.MATE_VALUE + self.MAX_MATE_PLY:
+            value -= self.board.ply - self.rootPly
+        self.transpositionTable.store(key, depth, value, type, move, explanation)
+
+    # (depth, value, type, move) of the position's entry, or None
+    def probeTT(self, key):
+        transpositionEntry = self.transpositionTable.probe(key)
+        if transpositionEntry != None:
+            depth, value, type, move = transpositionEntry
+            if value >= self.MATE_VALUE - self.MAX_MATE_PLY:
+                return depth, value - (self.board.ply - self.rootPly), type, move
+            elif value <= -self.MATE_VALUE + self.MAX_MATE_PLY:
+                return depth, value + (self.board.ply - self.rootPly), type, move
+        return transpositionEntry
+
+    # Moves with the transposition table's move for the position, if any, brought to the front
+    def hashMoveFirst(self, moves, transpositionEntry):
+        if transpositionEntry != None and transpositionEntry[3] in moves:
+            moves.remove(transpositionEntry[3])
+            moves.insert(0, transpositionEntry[3])
+        return moves
+
+    # Quiet moves that caused a beta cutoff, two per ply, tried early at other nodes of the same ply
+    def storeKiller(self, move):
+        if move >> 12 >= 4:
+            return
+        killers = self.killers.setdefault(self.board.ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
     def evalIterativeDeepening(self, eval_depth, quiescenceDepth=20):
+        self.rootPly = self.board.ply
         moves = self.board.generateMoves()
         for depth in range(eval_depth):
             moves = self.orderMoves(moves)
@@ -307,7 +411,7 @@ class Engine:
             self.board.unmake(moves[0])
             for move in moves[1:]:
                 self.board.applyMove(move)
-                if self.board.toPlay == colour.Colour.BLACK:
+                if self.board.toPlay == colour.BLACK:
                     eval = self.eval(depth, alpha=bestEval, quiescenceDepth=quiescenceDepth)
                     bestEval = max(bestEval, eval)
                 else:
@@ -317,56 +421,71 @@ class Engine:
         return bestEval
 
     def eval(self, depth, alpha=-float('inf'), beta=float('inf'), quiescenceDepth=10):
-        key = self.board.generateTTKey()
-        transpositionEntry = None
-        if key in self.transpositionTable:
-            transpositionEntry = self.transpositionTable[key]
-            if transpositionEntry.type == 1 and transpositionEntry.depth >= depth:
-                return transpositionEntry.getValue()
-
         if depth == 0:
-            value = self.quiescenceEval(quiescenceDepth, alpha, beta)
-            newEntry = ttentry.TTEntry(0, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
-            return value
+            return self.quiescenceEval(quiescenceDepth, alpha, beta)
+
+        key = self.board.hash
+        transpositionEntry = self.probeTT(key)
+        hashMove = None
+        if transpositionEntry != None:
+            entryDepth, value, entryType, entryMove = transpositionEntry
+            if entryDepth >= depth:
+                if entryType == 1:
+                    return value
+                elif entryType == 2:
+                    if value > beta:
+                        return value
+                    alpha = max(alpha, value)
+                elif entryType == 3:
+                    if value < alpha:
+                        return value
+                    beta = min(beta, value)
+            hashMove = entryMove or None
         
-        moves = self.board.generateMoves()
-        moves = self.orderMoves(moves)
-
-        if len(moves) == 0:
-            value = self.heuristicEval(moves)
-            newEntry = ttentry.TTEntry(0, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
-            return value
+        # The window the table may have narrowed, which the children are searched against. A value outside
+        # it is only a bound, even if it lies inside the window the node was called with
+        alphaWindow, betaWindow = alpha, beta
+        moves = self.pickMoves(hashMove, tuple(self.killers.get(self.board.ply, ())))
+        bestMove = 0
         
-        if self.board.toPlay == colour.Colour.WHITE:
+        if self.board.toPlay == colour.WHITE:
             value = -float('inf')
             for move in moves:
                 self.board.applyMove(move)
-                value = max(value, self.eval(depth-1, alpha, beta, quiescenceDepth))
+                moveValue = self.eval(depth-1, alpha, beta, quiescenceDepth)
                 self.board.unmake(move)
+                if moveValue > value:
+                    value = moveValue
+                    bestMove = move
                 if value > beta:
-                    newEntry = ttentry.TTEntry(depth, value, 2, self.board.age())
-                    self.transpositionTable[key] = newEntry
+                    self.storeKiller(move)
+                    self.storeTT(key, depth, value, 2, move)
                     return value
                 alpha = max(alpha, value)
-            newEntry = ttentry.TTEntry(depth, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
-            return value
+            valueType = self.boundType(value, alphaWindow, beta)
         else:
             value = float('inf')
             for move in moves:
                 self.board.applyMove(move)
-                value = min(value, self.eval(depth-1, alpha, beta, quiescenceDepth))
+                moveValue = self.eval(depth-1, alpha, beta, quiescenceDepth)
                 self.board.unmake(move)
+                if moveValue < value:
+                    value = moveValue
+                    bestMove = move
                 if value < alpha:
-                    newEntry = ttentry.TTEntry(depth, value, 3, self.board.age())
-                    self.transpositionTable[key] = newEntry
+                    self.storeKiller(move)
+                    self.storeTT(key, depth, value, 3, move)
                     return value
                 beta = min(beta, value)
-            newEntry = ttentry.TTEntry(depth, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
+            valueType = self.boundType(value, alpha, betaWindow)
+
+        # The value only stays infinite if there was no legal move to search
+        if value == float('inf') or value == -float('inf'):
+            value = self.heuristicEval([])
+            self.storeTT(key, depth, value, 1)
             return value
+        self.storeTT(key, depth, value, valueType, bestMove)
+        return value
         
     def evalWithoutAlphaBeta(self, depth):
         if depth == 0:
@@ -379,7 +498,7 @@ class Engine:
             value = self.heuristicEval(moves)
             return value
         
-        if self.board.toPlay == colour.Colour.WHITE:
+        if self.board.toPlay == colour.WHITE:
             value = -float('inf')
             for move in moves:
                 self.board.applyMove(move)
@@ -395,32 +514,39 @@ class Engine:
             return value
     
     def evalReason(self, depth, alpha=-float('inf'), beta=float('inf'), quiescenceDepth=10):
-        key = self.board.generateTTKey()
-        transpositionEntry = None
-        if key in self.transpositionTable:
-            transpositionEntry = self.transpositionTable[key]
-            if transpositionEntry.type == 1 and transpositionEntry.depth >= depth:
-                return transpositionEntry.value, transpositionEntry.reason, transpositionEntry.cont
-
         if depth == 0:
-            value, reason, cont = self.quiescenceEvalReason(quiescenceDepth, alpha, beta)
-            newEntry = ttentry.TTEntryReason(0, value, 1, self.board.age(), reason, cont)
-            self.transpositionTable[key] = newEntry
-            return value, reason, cont
+            return self.quiescenceEvalReason(quiescenceDepth, alpha, beta)
+
+        key = self.board.hash
+        transpositionEntry = self.probeTT(key)
+        hashMove = None
+        if transpositionEntry != None:
+            entryDepth, value, entryType, entryMove = transpositionEntry
+            if entryDepth >= depth:
+                # Only PV nodes keep an explanation. A cutoff is explained by the position's own evaluation: a
+                # bound should never become the value of a node searched with an open window, but one shifted by
+                # search instability still has to be shown or cached as a well-formed reason
+                if entryType == 1:
+                    explanation = self.transpositionTable.explanation(key)
+                    if explanation != None:
+                        return value, explanation[0], explanation[1]
+                elif entryType == 2:
+                    if value > beta:
+                        return value, self.heuristicEvalReason()[1], []
+                    alpha = max(alpha, value)
+                elif entryType == 3:
+                    if value < alpha:
+                        return value, self.heuristicEvalReason()[1], []
+                    beta = min(beta, value)
+            hashMove = entryMove or None
         
-        moves = self.board.generateMoves()
-        moves = self.orderMoves(moves)
-
-        if len(moves) == 0:
-            value, reason = self.heuristicEvalReason(moves)
-            newEntry = ttentry.TTEntryReason(0, value, 1, self.board.age(), reason, [])
-            self.transpositionTable[key] = newEntry
-            return value, reason, []
+        alphaWindow, betaWindow = alpha, beta
+        moves = self.pickMoves(hashMove)
         
         reason = ["Err", 0, 0, 0, 0]
         cont = []
         
-        if self.board.toPlay == colour.Colour.WHITE:
+        if self.board.toPlay == colour.WHITE:
             value = -float('inf')
             for move in moves:
                 self.board.applyMove(move)
@@ -431,13 +557,10 @@ class Engine:
                     cont = [move]+move_cont
                 self.board.unmake(move)
                 if value > beta:
-                    newEntry = ttentry.TTEntryReason(depth, value, 2, self.board.age(), reason, cont)
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, depth, value, 2, move)
                     return value, reason, cont
                 alpha = max(alpha, value)
-            newEntry = ttentry.TTEntryReason(depth, value, 1, self.board.age(), reason, cont)
-            self.transpositionTable[key] = newEntry
-            return value, reason, cont
+            valueType = self.boundType(value, alphaWindow, beta)
         else:
             value = float('inf')
             for move in moves:
@@ -449,82 +572,108 @@ class Engine:
                     cont = [move]+move_cont
                 self.board.unmake(move)
                 if value < alpha:
-                    newEntry = ttentry.TTEntryReason(depth, value, 3, self.board.age(), reason, cont)
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, depth, value, 3, move)
                     return value, reason, cont
                 beta = min(beta, value)
-            newEntry = ttentry.TTEntryReason(depth, value, 1, self.board.age(), reason, cont)
-            self.transpositionTable[key] = newEntry
-            return value, reason, cont
+            valueType = self.boundType(value, alpha, betaWindow)
+
+        # The value only stays infinite if there was no legal move to search
+        if value == float('inf') or value == -float('inf'):
+            value, reason = self.heuristicEvalReason([])
+            self.storeTT(key, depth, value, 1, 0, (reason, []) if alpha < value < beta else None)
+            return value, reason, []
+        self.storeTT(key, depth, value, valueType, cont[0], (reason, cont) if valueType == 1 else None)
+        return value, reason, cont
 
     def quiescenceEval(self, depth, alpha=-float('inf'), beta=float('inf')):
-        allMoves = self.board.generateMoves()
-        moves = self.board.filterQuiescenceMoves(allMoves)
-        moves = self.orderMoves(moves)
+        key = self.board.hash
+        transpositionEntry = self.probeTT(key)
+        if transpositionEntry != None:
+            _, value, entryType, _ = transpositionEntry
+            if entryType == 1:
+                return value
+            elif entryType == 2:
+                if value >= beta:
+                    return value
+                alpha = max(alpha, value)
+            elif entryType == 3:
+                if value <= alpha:
+                    return value
+                beta = min(beta, value)
 
-        key = self.board.generateTTKey()
-        transpositionEntry = None
-        if key in self.transpositionTable:
-            transpositionEntry = self.transpositionTable[key]
-            if transpositionEntry.type == 1:
-                return transpositionEntry.value
+        alphaWindow, betaWindow = alpha, beta
+        loudMoves, hasMove = self.board.quiescenceMoves()
+        goodCaptures, promotions, badCaptures = self.orderLoudMoves(loudMoves)
+        moves = self.hashMoveFirst(goodCaptures + promotions + badCaptures, transpositionEntry)
 
         if depth == 0 or len(moves) == 0:
-            value = self.heuristicEval(allMoves)
-            newEntry = ttentry.TTEntry(0, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
+            value = self.heuristicEval(hasMove=hasMove)
+            self.storeTT(key, 0, value, 1)
             return value
         
-        if self.board.toPlay == colour.Colour.WHITE:
-            value = self.heuristicEval(allMoves)
+        bestMove = 0
+        if self.board.toPlay == colour.WHITE:
+            value = self.heuristicEval(hasMove=hasMove)
             for move in moves:
                 self.board.applyMove(move)
-                value = max(value, self.quiescenceEval(depth-1, alpha, beta))
+                moveValue = self.quiescenceEval(depth-1, alpha, beta)
                 self.board.unmake(move)
+                if moveValue > value:
+                    value = moveValue
+                    bestMove = move
                 if value >= beta:
-                    newEntry = ttentry.TTEntry(0, value, 2, self.board.age())
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, 0, value, 2, move)
                     return value
                 alpha = max(alpha, value)
-            newEntry = ttentry.TTEntry(0, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
+            self.storeTT(key, 0, value, self.boundType(value, alphaWindow, beta), bestMove)
             return value
         else:
-            value = self.heuristicEval(allMoves)
+            value = self.heuristicEval(hasMove=hasMove)
             for move in moves:
                 self.board.applyMove(move)
-                value = min(value, self.quiescenceEval(depth-1, alpha, beta))
+                moveValue = self.quiescenceEval(depth-1, alpha, beta)
                 self.board.unmake(move)
+                if moveValue < value:
+                    value = moveValue
+                    bestMove = move
                 if value <= alpha:
-                    newEntry = ttentry.TTEntry(0, value, 3, self.board.age())
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, 0, value, 3, move)
                     return value
                 beta = min(beta, value)
-            newEntry = ttentry.TTEntry(0, value, 1, self.board.age())
-            self.transpositionTable[key] = newEntry
+            self.storeTT(key, 0, value, self.boundType(value, alpha, betaWindow), bestMove)
             return value
     
     def quiescenceEvalReason(self, depth, alpha=-float('inf'), beta=float('inf')):
-        allMoves = self.board.generateMoves()
-        moves = self.board.filterQuiescenceMoves(allMoves)
-        moves = self.orderMoves(moves)
-        
-        key = self.board.generateTTKey()
-        transpositionEntry = None
-        if key in self.transpositionTable:
-            transpositionEntry = self.transpositionTable[key]
-            if transpositionEntry.type == 1:
-                return transpositionEntry.value, transpositionEntry.reason, transpositionEntry.cont
+        key = self.board.hash
+        transpositionEntry = self.probeTT(key)
+        if transpositionEntry != None:
+            _, value, entryType, _ = transpositionEntry
+            if entryType == 1:
+                explanation = self.transpositionTable.explanation(key)
+                if explanation != None:
+                    return value, explanation[0], explanation[1]
+            elif entryType == 2:
+                if value > beta:
+                    return value, self.heuristicEvalReason()[1], []
+                alpha = max(alpha, value)
+            elif entryType == 3:
+                if value < alpha:
+                    return value, self.heuristicEvalReason()[1], []
+                beta = min(beta, value)
+
+        alphaWindow, betaWindow = alpha, beta
+        loudMoves, hasMove = self.board.quiescenceMoves()
+        goodCaptures, promotions, badCaptures = self.orderLoudMoves(loudMoves)
+        moves = self.hashMoveFirst(goodCaptures + promotions + badCaptures, transpositionEntry)
 
         if depth == 0 or len(moves) == 0:
-            value, reason = self.heuristicEvalReason(allMoves)
-            newEntry = ttentry.TTEntryReason(0, value, 1, self.board.age(), reason, [])
-            self.transpositionTable[key] = newEntry
+            value, reason = self.heuristicEvalReason(hasMove=hasMove)
+            self.storeTT(key, 0, value, 1, 0, (reason, []) if alpha < value < beta else None)
             return value, reason, []
         
         cont = []
-        if self.board.toPlay == colour.Colour.WHITE:
-            value, reason = self.heuristicEvalReason(allMoves)
+        if self.board.toPlay == colour.WHITE:
+            value, reason = self.heuristicEvalReason(hasMove=hasMove)
             for move in moves:
                 self.board.applyMove(move)
                 move_value, move_reason, move_cont = self.quiescenceEvalReason(depth-1, alpha, beta)
@@ -534,15 +683,14 @@ class Engine:
                     cont = [move]+move_cont
                 self.board.unmake(move)
                 if value > beta:
-                    newEntry = ttentry.TTEntryReason(depth, value, 2, self.board.age(), reason, cont)
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, 0, value, 2, move)
                     return value, reason, cont
                 alpha = max(alpha, value)
-            newEntry = ttentry.TTEntryReason(depth, value, 1, self.board.age(), reason, cont)
-            self.transpositionTable[key] = newEntry
+            valueType = self.boundType(value, alphaWindow, beta)
+            self.storeTT(key, 0, value, valueType, cont[0] if cont else 0, (reason, cont) if valueType == 1 else None)
             return value, reason, cont
         else:
-            value, reason = self.heuristicEvalReason(allMoves)
+            value, reason = self.heuristicEvalReason(hasMove=hasMove)
             for move in moves:
                 self.board.applyMove(move)
                 move_value, move_reason, move_cont = self.quiescenceEvalReason(depth-1, alpha, beta)
@@ -552,24 +700,32 @@ class Engine:
                     cont = [move]+move_cont
                 self.board.unmake(move)
                 if value < alpha:
-                    newEntry = ttentry.TTEntryReason(depth, value, 3, self.board.age(), reason, cont)
-                    self.transpositionTable[key] = newEntry
+                    self.storeTT(key, 0, value, 3, move)
                     return value, reason, cont
                 beta = min(beta, value)
-            newEntry = ttentry.TTEntryReason(depth, value, 1, self.board.age(), reason, cont)
-            self.transpositionTable[key] = newEntry
+            valueType = self.boundType(value, alpha, betaWindow)
+            self.storeTT(key, 0, value, valueType, cont[0] if cont else 0, (reason, cont) if valueType == 1 else None)
             return value, reason, cont
         
-    # Remove old entries in the transposition table
-    def gcTranspositionTable(self):
-        age = self.board.age()
-        keys = list(self.transpositionTable.keys())
-        for key in keys:
-            if self.transpositionTable[key].age <= age:
-                self.transpositionTable.pop(key)
+    # The cached (depth, quiescenceDepth, value, move, reason, cont) of a search of the position, if it is known,
+    # searched captures at least as deep and holds a legal move
+    def probeCache(self, moves, quiescenceDepth, reason=False):
+        if self.analysisCache == None:
+            return None
+        cached = self.analysisCache.probe(self.board.hash)
+        if cached == None or cached[1] < quiescenceDepth or cached[3] not in moves:
+            return None
+        if reason and cached[4] == None:
+            return None
+        return cached
+
+    def storeCache(self, depth, quiescenceDepth, value, move, reason=None, cont=()):
+        if self.analysisCache != None:
+            self.analysisCache.store(self.board.hash, depth, quiescenceDepth, value, move, reason, cont)
 
     def bestMove(self, eval_depth=5, quiescenceDepth=10, perMove=10):
-        self.gcTranspositionTable()
+        self.rootPly = self.board.ply
+        self.transpositionTable.newSearch()
         start = time.time()
         moves = self.board.generateMoves()
         if len(moves) == 1:
@@ -577,15 +733,23 @@ class Engine:
             eval = self.heuristicEval()
             self.board.unmake(moves[0])
             return moves[0], eval
-        for depth in range(eval_depth+1):
+        # A cached search at least as deep is returned as it is, and a shallower one is carried on from the next depth
+        completed = self.probeCache(moves, quiescenceDepth)
+        if completed != None and completed[0] >= eval_depth:
+            return completed[3], completed[2]
+        firstDepth = 0 if completed == None else completed[0]+1
+        for depth in range(firstDepth, eval_depth+1):
             moves = self.orderMoves(moves)
+            if completed != None and depth == firstDepth:
+                moves.remove(completed[3])
+                moves.insert(0, completed[3])
             bestMove = moves[0]
             self.board.applyMove(bestMove)
             bestEval = self.eval(depth, quiescenceDepth=quiescenceDepth)
             self.board.unmake(bestMove)
             for move in moves[1:]:
                 self.board.applyMove(move)
-                if self.board.toPlay == colour.Colour.BLACK:
+                if self.board.toPlay == colour.BLACK:
                     eval = self.eval(depth, alpha=bestEval, quiescenceDepth=quiescenceDepth)
                     if eval > bestEval:
                         bestEval = eval
@@ -597,11 +761,17 @@ class Engine:
                         bestMove = move
                 self.board.unmake(move)
                 if time.time() - start > perMove:
+                    # Only the last depth searched to the end is worth keeping
+                    if completed != None:
+                        self.storeCache(*completed)
                     return bestMove, bestEval
+            completed = (depth, quiescenceDepth, bestEval, bestMove, None, [])
+        self.storeCache(*completed)
         return bestMove, bestEval
     
     def bestMoveReason(self, eval_depth=5, quiescenceDepth=10, perMove=10):
-        self.gcTranspositionTable()
+        self.rootPly = self.board.ply
+        self.transpositionTable.newSearch()
         start = time.time()
         moves = self.board.generateMoves()
         if len(moves) == 1:
@@ -609,8 +779,15 @@ class Engine:
             eval, reason = self.heuristicEvalReason()
             self.board.unmake(moves[0])
             return moves[0], eval, reason, []
-        for depth in range(eval_depth+1):
+        completed = self.probeCache(moves, quiescenceDepth, reason=True)
+        if completed != None and completed[0] >= eval_depth:
+            return completed[3], completed[2], completed[4], completed[5]
+        firstDepth = 0 if completed == None else completed[0]+1
+        for depth in range(firstDepth, eval_depth+1):
             moves = self.orderMoves(moves)
+            if completed != None and depth == firstDepth:
+                moves.remove(completed[3])
+                moves.insert(0, completed[3])
             bestMove = moves[0]
             self.board.applyMove(bestMove)
             bestEval, bestReason, cont = self.evalReason(depth, quiescenceDepth=quiescenceDepth)
@@ -618,7 +795,7 @@ class Engine:
             self.board.unmake(bestMove)
             for move in moves[1:]:
                 self.board.applyMove(move)
-                if self.board.toPlay == colour.Colour.BLACK:
+                if self.board.toPlay == colour.BLACK:
                     eval, reason, cont = self.evalReason(depth, alpha=bestEval, quiescenceDepth=quiescenceDepth)
                     if eval > bestEval:
                         bestEval = eval
@@ -634,5 +811,9 @@ class Engine:
                         bestCont = [move]+cont
                 self.board.unmake(move)
                 if time.time() - start > perMove:
+                    if completed != None:
+                        self.storeCache(*completed)
                     return bestMove, bestEval, bestReason, bestCont
+            completed = (depth, quiescenceDepth, bestEval, bestMove, bestReason, bestCont)
+        self.storeCache(*completed)
         return bestMove, bestEval, bestReason, bestCont
@@ -0,0 +1,84 @@
+import colour
+import board
+from bitarray_masks import bitSquares, KING_ATTACK_BITS, FULL_FILE_BITS
+
+# Square i of the board is bit i of each piece set (a1 = bit 0, h8 = bit 63)
+
+
+class IntBoard(board.Board):
+
+    def clearPieces(self):
+        for name in self.PIECE_SETS.values():
+            setattr(self, name, 0)
+        self.whitePieces = 0
+        self.blackPieces = 0
+        self.pieces = 0
+
+        self.mailbox = [None] * 64
+        self.pieceCounts = {char: 0 for char in self.PIECE_SETS}
+
+    def putPiece(self, char, position: int):
+        bit = 1 << position
+        name = self.PIECE_SETS[char]
+        setattr(self, name, getattr(self, name) | bit)
+        if char.isupper():
+            self.whitePieces |= bit
+        else:
+            self.blackPieces |= bit
+        self.pieces |= bit
+        self.mailbox[position] = char
+        self.pieceCounts[char] += 1
+
+    def removePiece(self, char, position: int):
+        bit = 1 << position
+        name = self.PIECE_SETS[char]
+        setattr(self, name, getattr(self, name) ^ bit)
+        if char.isupper():
+            self.whitePieces ^= bit
+        else:
+            self.blackPieces ^= bit
+        self.pieces ^= bit
+        self.mailbox[position] = None
+        self.pieceCounts[char] -= 1
+
+    def movePiece(self, char, startPos: int, endPos: int):
+        bits = 1 << startPos | 1 << endPos
+        name = self.PIECE_SETS[char]
+        setattr(self, name, getattr(self, name) ^ bits)
+        if char.isupper():
+            self.whitePieces ^= bits
+        else:
+            self.blackPieces ^= bits
+        self.pieces ^= bits
+        self.mailbox[startPos] = None
+        self.mailbox[endPos] = char
+
+    @staticmethod
+    def popCount(bits) -> int:
+        return bits.bit_count()
+
+    @staticmethod
+    def testBit(bits, position: int) -> bool:
+        return bits >> position & 1 == 1
+
+    @staticmethod
+    def toBits(bits) -> int:
+        return bits
+
+    @staticmethod
+    def setSquares(bits):
+        return bitSquares(bits)
+
+    @staticmethod
+    def fileBits(file: int):
+        return FULL_FILE_BITS[file]
+
+    @staticmethod
+    def kingAttackBits(position: int):
+        return KING_ATTACK_BITS[position]
+
+    def kingSquare(self, col) -> int:
+        if col == colour.WHITE:
+            return self.whiteKing.bit_length() - 1
+        return self.blackKing.bit_length() - 1
+
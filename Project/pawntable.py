@@ -0,0 +1,39 @@
+from array import array
+
+# Fixed-size table of pawn structure terms, keyed by the board's pawn key. Pawns move far less often than
+# other pieces, so most positions reached by a search share their pawn structure with one evaluated before.
+# Each slot holds the key and, for each colour, its count of weak pawns (doubled or isolated) and of pawn
+# connections. A key picks its slot by its low bits, and a new structure always replaces the one there.
+class PawnTable():
+    SLOT_BYTES = 8 + 4 * 8
+
+    def __init__(self, sizeMB=1):
+        slots = max(1, sizeMB * 2**20 // self.SLOT_BYTES)
+        # Round down to a power of two so that the slot is the key masked to its low bits
+        slots = 1 << (slots.bit_length() - 1)
+        self.mask = slots - 1
+        self.size = slots
+
+        self.keys = array('Q', bytes(8 * slots))
+        self.terms = array('q', bytes(32 * slots))
+
+        self.hits = 0
+        self.misses = 0
+
+    # (whiteWeak, whiteConnections, blackWeak, blackConnections) of the pawn structure, or None
+    def probe(self, key: int):
+        slot = key & self.mask
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.terms[4*slot:4*slot+4]
+        self.misses += 1
+        return None
+
+    def store(self, key: int, whiteWeak: int, whiteConnections: int, blackWeak: int, blackConnections: int):
+        slot = key & self.mask
+        self.keys[slot] = key
+        self.terms[4*slot:4*slot+4] = array('q', (whiteWeak, whiteConnections, blackWeak, blackConnections))
+
+    def stats(self) -> dict:
+        probes = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / probes if probes else 0}
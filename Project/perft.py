@@ -0,0 +1,135 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import BOARD_BACKENDS
+from bitarray_masks import moveToAlgebraic
+
+SUITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "perft.epd")
+RESULT_FIELDS = ["backend", "fen", "depth", "expected", "nodes", "passed", "seconds", "nps"]
+# Subtree counts each worker process keeps between root moves, dropped once this large
+MAX_CACHE_ENTRIES = 2000000
+_workerCache = {}
+
+# Each line of the suite is a FEN followed by ";Dn count" operations giving the expected leaf nodes at depth n
+def loadSuite(path=SUITE_PATH):
+    positions = []
+    with open(path) as suiteFile:
+        for line in suiteFile:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(";")
+            expected = {}
+            for field in fields[1:]:
+                depth, nodes = field.split()
+                expected[int(depth[1:])] = int(nodes)
+            positions.append((fields[0].strip(), expected))
+    return positions
+
+def subtreeNodes(board, depth, bulk=True, hashed=False, cache=None):
+    if hashed:
+        return board.hashPerft(depth, cache, bulk)
+    return board.perft(depth, bulk)
+
+def _rootMoveNodes(backend, fen, move, depth, bulk, hashed):
+    if len(_workerCache) > MAX_CACHE_ENTRIES:
+        _workerCache.clear()
+    board = BOARD_BACKENDS[backend](fen)
+    board.applyMove(move)
+    return subtreeNodes(board, depth-1, bulk, hashed, _workerCache)
+
+# Node counts of each root move; with an executor the root moves are searched in its worker processes
+def divideNodes(fen, backend, depth, bulk=True, hashed=False, executor=None) -> dict:
+    board = BOARD_BACKENDS[backend](fen)
+    moves = board.generateMoves()
+    if executor == None:
+        cache = {}
+        counts = []
+        for move in moves:
+            board.applyMove(move)
+            counts.append(subtreeNodes(board, depth-1, bulk, hashed, cache))
+            board.unmake(move)
+    else:
+        futures = [executor.submit(_rootMoveNodes, backend, fen, move, depth, bulk, hashed) for move in moves]
+        counts = [future.result() for future in futures]
+    return {moveToAlgebraic(move): count for move, count in zip(moves, counts)}
+
+def perftNodes(fen, backend, depth, bulk=True, hashed=False, executor=None) -> int:
+    if executor == None or depth < 2:
+        return subtreeNodes(BOARD_BACKENDS[backend](fen), depth, bulk, hashed)
+    return sum(divideNodes(fen, backend, depth, bulk, hashed, executor).values())
+
+def runSuite(positions, backends, maxDepth, bulk=True, hashed=False, executor=None):
+    results = []
+    for backend in backends:
+        for fen, expected in positions:
+            for depth in sorted(expected):
+                if depth > maxDepth:
+                    break
+                start = time.perf_counter()
+                nodes = perftNodes(fen, backend, depth, bulk, hashed, executor)
+                seconds = time.perf_counter() - start
+                result = {"backend": backend, "fen": fen, "depth": depth, "expected": expected[depth], "nodes": nodes,
+                          "passed": nodes == expected[depth], "seconds": round(seconds, 4), "nps": int(nodes / seconds) if seconds else 0}
+                print("{:8} {:2} {:>10} {:>10} {:4} {:>8.2f}s {:>9} nps  {}".format(
+                    backend, depth, nodes, expected[depth], "ok" if result["passed"] else "FAIL", seconds, result["nps"], fen), flush=True)
+                results.append(result)
+    return results
+
+def writeResults(results, path):
+    with open(path, "w", newline="") as resultFile:
+        writer = csv.DictWriter(resultFile, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+def printDivide(fen, depth, backend, bulk=True, hashed=False, executor=None):
+    start = time.perf_counter()
+    counts = divideNodes(fen, backend, depth, bulk, hashed, executor)
+    seconds = time.perf_counter() - start
+    for move in sorted(counts):
+        print(move + ":", counts[move])
+    total = sum(counts.values())
+    print()
+    print("Moves:", len(counts))
+    print("Nodes:", total)
+    print("Time: {:.2f}s ({} nps)".format(seconds, int(total / seconds) if seconds else 0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark move generation against a perft suite")
+    parser.add_argument("--depth", type=int, default=3, help="deepest depth of the suite to run (default 3)")
+    parser.add_argument("--backend", choices=sorted(BOARD_BACKENDS) + ["all"], default="all")
+    parser.add_argument("--epd", default=SUITE_PATH, help="perft suite to run")
+    parser.add_argument("--output", help="where to write the results as CSV (not written by default)")
+    parser.add_argument("--no-bulk", dest="bulk", action="store_false", help="play out the last ply instead of counting it")
+    parser.add_argument("--divide", metavar="FEN", help="print the node count of each root move of FEN at --depth instead")
+    parser.add_argument("--hash", dest="hashed", action="store_true", help="cache subtree counts by position and depth")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes to split root moves across (default 1)")
+    args = parser.parse_args()
+
+    backends = sorted(BOARD_BACKENDS) if args.backend == "all" else [args.backend]
+    executor = ProcessPoolExecutor(args.jobs) if args.jobs > 1 else None
+    try:
+        if args.divide:
+            for backend in backends:
+                print(backend)
+                printDivide(args.divide, args.depth, backend, args.bulk, args.hashed, executor)
+            return
+        results = runSuite(loadSuite(args.epd), backends, args.depth, args.bulk, args.hashed, executor)
+    finally:
+        if executor != None:
+            executor.shutdown()
+
+    if args.output:
+        writeResults(results, args.output)
+    failed = [result for result in results if not result["passed"]]
+    nodes = sum(result["nodes"] for result in results)
+    seconds = sum(result["seconds"] for result in results)
+    print("{} of {} passed, {} nodes in {:.2f}s ({} nps)".format(len(results) - len(failed), len(results), nodes, seconds, int(nodes / seconds) if seconds else 0))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
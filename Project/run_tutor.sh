@@ -3,3 +3,6 @@ xboard -fcp "python3 Project/xboard_engine.py" &
 python Project/tutor.py &
 
 wait
+
+# The engine and the tutor share a transposition table in shared memory, which outlives them until removed
+python -c "import sys; sys.path.insert(0, 'Project'); from transpositiontable import unlinkShared; from engine import SHARED_TT_NAME; unlinkShared(SHARED_TT_NAME)"
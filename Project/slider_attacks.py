@@ -0,0 +1,48 @@
+from bitarray_masks import RAY_SQUARES
+
+# Attack sets of sliding pieces for every square and every occupancy, as ints (square i = bit i).
+# Only the occupancy of the squares a slider could be blocked on matters, so each table is indexed
+# by the occupancy masked to those squares (each ray without its final square).
+
+ROOK_STEPS = (-8, -1, 1, 8)
+BISHOP_STEPS = (-9, -7, 7, 9)
+
+def _walkRays(position: int, occupancy: int, steps) -> int:
+    result = 0
+    for step in steps:
+        for square in RAY_SQUARES[position][step]:
+            result |= 1 << square
+            if occupancy >> square & 1:
+                break
+    return result
+
+def _blockerBits(position: int, steps) -> int:
+    result = 0
+    for step in steps:
+        for square in RAY_SQUARES[position][step][:-1]:
+            result |= 1 << square
+    return result
+
+def _buildTable(position: int, blockers: int, steps) -> dict:
+    table = {}
+    # Enumerate every subset of the blocker squares (carry-rippler)
+    occupancy = 0
+    while True:
+        table[occupancy] = _walkRays(position, occupancy, steps)
+        occupancy = (occupancy - blockers) & blockers
+        if occupancy == 0:
+            return table
+
+ROOK_BLOCKER_BITS = [_blockerBits(i, ROOK_STEPS) for i in range(64)]
+BISHOP_BLOCKER_BITS = [_blockerBits(i, BISHOP_STEPS) for i in range(64)]
+ROOK_ATTACK_TABLES = [_buildTable(i, ROOK_BLOCKER_BITS[i], ROOK_STEPS) for i in range(64)]
+BISHOP_ATTACK_TABLES = [_buildTable(i, BISHOP_BLOCKER_BITS[i], BISHOP_STEPS) for i in range(64)]
+
+def rookAttacks(position: int, occupancy: int) -> int:
+    return ROOK_ATTACK_TABLES[position][occupancy & ROOK_BLOCKER_BITS[position]]
+
+def bishopAttacks(position: int, occupancy: int) -> int:
+    return BISHOP_ATTACK_TABLES[position][occupancy & BISHOP_BLOCKER_BITS[position]]
+
+def queenAttacks(position: int, occupancy: int) -> int:
+    return ROOK_ATTACK_TABLES[position][occupancy & ROOK_BLOCKER_BITS[position]] | BISHOP_ATTACK_TABLES[position][occupancy & BISHOP_BLOCKER_BITS[position]]
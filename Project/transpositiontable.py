@@ -0,0 +1,185 @@
+import atexit
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from ttentry import pack, unpack, entryDepth, entryType, entryGeneration, entryMove
+
+# Fixed-size transposition table of two words per slot: the position's Zobrist key XORed with its entry, and
+# the entry packed by ttentry. A slot only matches a key if the two words still XOR to it, so a slot torn by
+# another process writing it at the same time reads as a miss rather than a wrong entry, and a table given a
+# name can be shared without locks by every engine process on the host that opens it. A key picks a bucket
+# of BUCKET_SIZE slots by its low bits; all but the last slot of a bucket keep the deepest entries stored
+# there, and the last slot takes whatever does not fit, so recent shallow entries are not lost. Entries are
+# never swept: each records the search generation that stored it, and entries of earlier searches are the
+# first to be overwritten, while still being found by probes until then. The generation is kept in a header
+# word ahead of the slots, so every process sharing the table agrees on it.
+# Explanations (reason and continuation) are only kept for PV nodes, in a side table of bounded size that
+# forgets the oldest first. An explanation is dropped whenever its position is stored again without one.
+class TranspositionTable():
+    BUCKET_SIZE = 4
+    SLOT_BYTES = 8 + 8
+    HEADER_BYTES = 8
+    MAX_EXPLANATIONS = 4096
+
+    def __init__(self, sizeMB=16, name=None):
+        buckets = max(1, sizeMB * 2**20 // (self.SLOT_BYTES * self.BUCKET_SIZE))
+        # Round down to a power of two so that the bucket is the key masked to its low bits
+        buckets = 1 << (buckets.bit_length() - 1)
+
+        # A named table lives in shared memory, created by the first process to open it; later ones take its size
+        self.name = name
+        self.memory = None
+        if name != None:
+            try:
+                self.memory = _openSharedMemory(name, True,
+                                                self.HEADER_BYTES + buckets * self.BUCKET_SIZE * self.SLOT_BYTES)
+            except FileExistsError:
+                self.memory = _openSharedMemory(name)
+                buckets = (self.memory.size - self.HEADER_BYTES) // (self.BUCKET_SIZE * self.SLOT_BYTES)
+        self.mask = buckets - 1
+        self.size = buckets * self.BUCKET_SIZE
+
+        if self.memory == None:
+            self.header = array('Q', bytes(self.HEADER_BYTES))
+            self.keys = array('Q', bytes(8 * self.size))
+            self.entries = array('Q', bytes(8 * self.size))
+        else:
+            start = self.HEADER_BYTES
+            self.header = self.memory.buf[:start].cast('Q')
+            self.keys = self.memory.buf[start:start + 8 * self.size].cast('Q')
+            self.entries = self.memory.buf[start + 8 * self.size:start + 16 * self.size].cast('Q')
+        # Explanations are never shared, as they are Python objects
+        self.explanations = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.collisions = 0
+
+    # Called at the start of each search, making everything stored before it replaceable, by any process
+    def newSearch(self):
+        self.header[0] = (self.header[0] + 1) & 255
+
+    @property
+    def generation(self) -> int:
+        return self.header[0]
+
+    # (depth, value, type, move) of the position's entry, or None
+    def probe(self, key: int):
+        start = (key & self.mask) * self.BUCKET_SIZE
+        keys, entries = self.keys, self.entries
+        for slot in range(start, start + self.BUCKET_SIZE):
+            entry = entries[slot]
+            if keys[slot] ^ entry == key:
+                if entryType(entry):
+                    self.hits += 1
+                    return unpack(entry)
+        self.misses += 1
+        return None
+
+    # (reason, cont) of a PV node, or None. Each explanation keeps the entry word it was stored with, since a
+    # process sharing the table may have replaced that entry since, leaving the explanation with another search
+    def explanation(self, key: int):
+        explained = self.explanations.get(key)
+        if explained == None:
+            return None
+        start = (key & self.mask) * self.BUCKET_SIZE
+        keys, entries = self.keys, self.entries
+        for slot in range(start, start + self.BUCKET_SIZE):
+            if entries[slot] == explained[0] and keys[slot] ^ explained[0] == key:
+                return explained[1]
+        return None
+
+    def store(self, key: int, depth: int, value: int, type: int, move=0, explanation=None):
+        start = (key & self.mask) * self.BUCKET_SIZE
+        last = start + self.BUCKET_SIZE - 1
+        keys, entries = self.keys, self.entries
+        generation = self.generation
+        target = -1
+        for slot in range(start, last + 1):
+            if keys[slot] ^ entries[slot] == key and entryType(entries[slot]):
+                target = slot
+                # A revisit that found no move keeps the one already known for the position
+                if not move:
+                    move = entryMove(entries[slot])
+                break
+        if target == -1:
+            # An empty depth-preferred slot, else the shallowest of those left by earlier searches, else the
+            # shallowest of this search's if this entry is at least as deep
+            target = start
+            targetRank = None
+            for slot in range(start, last):
+                entry = entries[slot]
+                if not entryType(entry):
+                    target = slot
+                    targetRank = None
+                    break
+                rank = (entryGeneration(entry) == generation, entryDepth(entry))
+                if targetRank == None or rank < targetRank:
+                    target = slot
+                    targetRank = rank
+            if targetRank != None and targetRank[0] and targetRank[1] > depth:
+                target = last
+            if entryType(entries[target]):
+                self.collisions += 1
+
+        self.stores += 1
+        entry = pack(move, value, depth, type, generation)
+        entries[target] = entry
+        keys[target] = key ^ entry
+        if explanation != None:
+            self.explanations.pop(key, None)
+            self.explanations[key] = (entry, explanation)
+            if len(self.explanations) > self.MAX_EXPLANATIONS:
+                del self.explanations[next(iter(self.explanations))]
+        elif key in self.explanations:
+            del self.explanations[key]
+
+    # Detaches from a shared table, which stays for other processes to open until unlinkShared removes it
+    def close(self):
+        if self.memory == None:
+            return
+        self.header.release()
+        self.keys.release()
+        self.entries.release()
+        self.memory.close()
+        self.memory = None
+        _sharedTables.pop(self.name, None)
+
+    # Fill is counted from the slots, since in a shared table other processes fill them too
+    def stats(self) -> dict:
+        probes = self.hits + self.misses
+        used = sum(1 for entry in self.entries if entryType(entry))
+        return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / probes if probes else 0,
+                "stores": self.stores, "collisions": self.collisions, "fill": used / self.size,
+                "explanations": len(self.explanations)}
+
+_sharedTables = {}
+
+# The process's table of the given name, opened on first use so that every engine in the process shares it
+def sharedTable(name, sizeMB=16):
+    if name not in _sharedTables:
+        _sharedTables[name] = TranspositionTable(sizeMB, name)
+        # The views into the shared memory have to be released before it can be unmapped at exit
+        atexit.register(_sharedTables[name].close)
+    return _sharedTables[name]
+
+# Removes a shared table's name, so that the next process to open it starts a new one. Processes still attached
+# keep theirs until they close it. Left to whoever started the processes sharing the table, once they have all
+# exited
+def unlinkShared(name):
+    try:
+        memory = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    memory.close()
+    memory.unlink()
+
+# Shared memory that is not handed to the resource tracker, which would otherwise remove it as soon as any
+# process that opened it exits, taking the table from the processes still sharing it
+def _openSharedMemory(name, create=False, size=0):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    memory = shared_memory.SharedMemory(name, create, size)
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
@@ -1,15 +1,22 @@
-class TTEntry():
-    def __init__(self, depth, value, type, age):
-        self.depth = depth
-        self.value = value
-        self.type = type
-        self.age = age
-
-    def getValue(self):
-        return self.value
-
-class TTEntryReason(TTEntry):
-    def __init__(self, depth, value, type, age, reason, cont):
-        super().__init__(depth, value, type, age)
-        self.reason = reason
-        self.cont = cont
\ No newline at end of file
+# A transposition table entry packed into one 64-bit word: the best or cutoff move (bits 0-15, 0 if none),
+# the value offset to be non-negative (bits 16-39), the depth (bits 40-47), the type (bits 48-55: 1 exact,
+# 2 lower bound, 3 upper bound, 0 for an empty slot) and the generation of the search that stored it (bits 56-63)
+VALUE_OFFSET = 1 << 23
+
+def pack(move: int, value: int, depth: int, type: int, generation: int) -> int:
+    return move | (value + VALUE_OFFSET) << 16 | depth << 40 | type << 48 | generation << 56
+
+def unpack(entry: int) -> tuple[int, int, int, int]:
+    return entry >> 40 & 255, (entry >> 16 & 0xFFFFFF) - VALUE_OFFSET, entry >> 48 & 255, entry & 0xFFFF
+
+def entryDepth(entry: int) -> int:
+    return entry >> 40 & 255
+
+def entryType(entry: int) -> int:
+    return entry >> 48 & 255
+
+def entryGeneration(entry: int) -> int:
+    return entry >> 56
+
+def entryMove(entry: int) -> int:
+    return entry & 0xFFFF
@@ -1,11 +1,14 @@
 from engine import *
 import time
 
+# Results of the tutor's searches kept between sessions, written out at the end of each game
+analysisCache = analysiscache.AnalysisCache(ANALYSIS_CACHE_PATH)
+
 class Tutor():
     def __init__(self, filename, depth=3):
         self.filename=filename
         self.last_position = 0
-        self.engine = Engine()
+        self.engine = Engine(ttName=SHARED_TT_NAME, analysisCache=analysisCache)
         self.depth=depth
 
     def read_new_messages(self):
@@ -21,11 +24,14 @@ class Tutor():
     def process_command(self, message):
         command = message.strip()
         if command == "new":
-            self.engine = Engine()
+            analysisCache.save()
+            self.engine = Engine(ttName=SHARED_TT_NAME, analysisCache=analysisCache)
             self.bestMove, self.bestEval, self.bestReason, self.bestCont = self.engine.bestMoveReason(self.depth, quiescenceDepth=12, perMove=20)
 
         elif command.startswith("quit"):
             # Respond to quit command
+            analysisCache.save()
+            self.engine.transpositionTable.close()
             quit()
 
         elif command.startswith("user"):
@@ -35,6 +41,7 @@ class Tutor():
             self.engine.board.applyMove(move)
 
             if self.engine.board.gameOver():
+                analysisCache.save()
                 print("\nGame over")
                 result = self.engine.board.getResult()
                 if result == -1:
@@ -62,6 +69,7 @@ class Tutor():
             self.engine.board.applyMove(move)
 
             if self.engine.board.gameOver():
+                analysisCache.save()
                 print("\nGame over")
                 result = self.engine.board.getResult()
                 if result == -1:
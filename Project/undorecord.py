@@ -0,0 +1,13 @@
+# State destroyed by a move that unmake cannot recompute: the captured piece (FEN character, None for a
+# quiet move), and the castling rights, en passant square, halfmove clock, Zobrist key and pawn key from before
+# the move
+class UndoRecord():
+    __slots__ = ('captured', 'castlingRights', 'enPassant', 'halfMoveClock', 'hash', 'pawnHash')
+
+    def __init__(self):
+        self.captured = None
+        self.castlingRights = 0
+        self.enPassant = -1
+        self.halfMoveClock = 0
+        self.hash = 0
+        self.pawnHash = 0
@@ -2,6 +2,9 @@ from engine import *
 
 filename="communication.txt"
 
+# Results of the engine's searches kept between sessions, written out at the end of each game
+analysisCache = analysiscache.AnalysisCache(ANALYSIS_CACHE_PATH)
+
 def write_message(message):
     with open(filename, "a") as file:
         file.write(message+'\n')
@@ -12,7 +15,7 @@ def clear_file():
 
 def playXBoard():
     clear_file()
-    engine = Engine()
+    engine = Engine(ttName=SHARED_TT_NAME, analysisCache=analysisCache)
     while True:
         try:
             command = input().strip()
@@ -23,8 +26,9 @@ def playXBoard():
 
             elif command == "new":
                 # Respond to new game command
-                engine = Engine()
-                engine.playing = colour.Colour.BLACK
+                analysisCache.save()
+                engine = Engine(ttName=SHARED_TT_NAME, analysisCache=analysisCache)
+                engine.playing = colour.BLACK
                 write_message("new")
 
             elif command.startswith("protover"):
@@ -39,6 +43,8 @@ def playXBoard():
                 # Respond to quit command
                 clear_file()
                 time.sleep(1)
+                analysisCache.save()
+                engine.transpositionTable.close()
                 quit()
 
             elif command.startswith("time"):
@@ -66,6 +72,7 @@ def playXBoard():
                     print("Illegal move:", move)
 
                 if engine.board.gameOver():
+                    analysisCache.save()
                     result = engine.board.getResult()
                     if result == -1:
                         print("0-1")
@@ -80,6 +87,10 @@ def playXBoard():
                     print("move", moveToAlgebraic(move))
                     write_message("engine "+ moveToAlgebraic(move))
 
+            elif command.startswith("result"):
+                # The game has ended
+                analysisCache.save()
+
             elif command.startswith("ping"):
                 # Respond to ping command
                 print("pong", command.split()[1])
@@ -87,14 +98,14 @@ def playXBoard():
             elif command.startswith("setboard"):
                 # Set the board to the given position
                 fen = " ".join(command.split()[1:])
-                engine = Engine(fen)
-                engine.playing = colour.Colour.BLACK
+                engine = Engine(fen, ttName=SHARED_TT_NAME, analysisCache=analysisCache)
+                engine.playing = colour.BLACK
 
             elif command.startswith("black"):
-                engine.playing = colour.Colour.BLACK
+                engine.playing = colour.BLACK
 
             elif command.startswith("white"):
-                engine.playing = colour.Colour.WHITE
+                engine.playing = colour.WHITE
 
             else:
                 # Unknown command, send "Error" response
@@ -0,0 +1,16 @@
+import random
+
+# Random 64-bit keys XORed together into the hash of a position: one per piece on each square, one for
+# black to move, one per set of castling rights and one per en passant file. The pawn key of a position only
+# XORs in the keys of its pawns, starting from NO_PAWNS_KEY so that a board without pawns has a key too. The
+# seed is fixed so that keys are the same in every process.
+_random = random.Random(0x5EED)
+
+def _key() -> int:
+    return _random.getrandbits(64)
+
+PIECE_KEYS = {char: [_key() for _ in range(64)] for char in 'PNBRQKpnbrqk'}
+SIDE_KEY = _key()
+CASTLING_KEYS = [0] + [_key() for _ in range(15)]
+EN_PASSANT_KEYS = [_key() for _ in range(8)]
+NO_PAWNS_KEY = _key()